@@ -0,0 +1,61 @@
+"""
+Benchmark the import of the feenox package and guard that it stays light: the script fails if requests, openpyxl
+or pyodbc are loaded by the import, as they must be imported only when first used.
+The import runs in a new interpreter with -X importtime, reporting its cumulative time.
+
+    python bench/bench_import_time.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PATH_SRC = Path(__file__).resolve().parents[1] / 'src'
+# HEAVY_MODULES: the modules that must not be loaded by the package import
+HEAVY_MODULES = ('requests', 'openpyxl', 'pyodbc')
+
+
+def import_feenox() -> tuple[float, list[str]]:
+    """
+    Import the feenox package in a new interpreter.
+
+    :return: A tuple with the cumulative import time in milliseconds and the heavy modules loaded.
+    :rtype: tuple[float, list[str]]
+    """
+    code = f'import sys, json, feenox; print(json.dumps([var for var in {HEAVY_MODULES!r} if var in sys.modules]))'
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=PATH_SRC,
+        env={**os.environ, 'PYTHONPATH': str(PATH_SRC)},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    # each line of -X importtime is 'import time: self [us] | cumulative | imported package'
+    cumulative = next(
+        int(line.split('|')[1])
+        for line in reversed(res.stderr.splitlines())
+        if line.startswith('import time:') and line.split('|')[2].strip() == 'feenox'
+    )
+    return cumulative / 1000, json.loads(res.stdout.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark and guard the import of the feenox package.')
+    parser.add_argument('--repeat', type=int, default=5, help='the imports done, the best one is reported')
+    args = parser.parse_args()
+
+    timings, loaded = [], []
+    for _ in range(args.repeat):
+        milliseconds, loaded = import_feenox()
+        timings.append(milliseconds)
+    print(f'import feenox  best {min(timings):.1f} ms, median {sorted(timings)[len(timings) // 2]:.1f} ms')
+
+    if loaded: sys.exit(f'import feenox loaded {", ".join(loaded)}... they must be imported only when used!')
+    print(f'none of {", ".join(HEAVY_MODULES)} loaded')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark the Excel export of a large query result, by feeding the rows of an in memory SQLite query to
+Querier.save_excel, and report the elapsed time and the peak resident memory of the process,
+against the old path, a normal workbook styled cell by cell and saved at the end.
+
+    python bench/bench_save_excel.py --rows 500000 --skip-baseline
+    python bench/bench_save_excel.py --rows 20000
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from core import LowQuerier, Querier
+
+# QUERY_ROWS: a synthetic result set with integer, floating, text and date columns, generated by SQLite itself
+QUERY_ROWS = """\
+    WITH RECURSIVE seq(nr) AS (
+        SELECT 1
+        UNION ALL
+        SELECT nr + 1 FROM seq WHERE nr < ?
+    )
+    SELECT nr AS id,
+        'C' || printf('%03d', nr % 997) AS customer_code,
+        (nr % 10000) / 100.0 AS net_amount,
+        (nr % 10000) / 100.0 * 1.22 AS gross_amount,
+        date('2025-01-01', '+' || (nr % 365) || ' days') AS exit_date,
+        CASE WHEN nr % 7 = 0 THEN NULL ELSE 'N' || (nr % 9) END AS network_code
+    FROM seq
+    ;
+"""
+
+
+def peak_rss() -> float | None:
+    """
+    Get the peak resident memory of the process in megabytes, None where the resource module is missing.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # the peak is in kilobytes on Linux and in bytes on macOS
+    return usage / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def legacy_save_excel(querier: Querier,
+                      fou: Path,
+                      sheet_name: str = None,
+                      font_face: str = None) -> None:
+    """
+    Save the last query result into an Excel file, as done before the write-only mode.
+    """
+    import openpyxl
+    from openpyxl.styles import Font
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    if sheet_name: ws.title = sheet_name
+
+    for col_num, cell in enumerate(querier.row_header(), start=1):
+        ws.cell(row=1, column=col_num).value = cell
+        ws.cell(row=1, column=col_num).font = Font(name=font_face, bold=True)
+        ws.cell(row=1, column=col_num).number_format = Querier._EXCEL_FORMATS.get(type(cell))
+
+    for row_num, row in enumerate(querier, start=2):
+        for col_num, cell in enumerate(row, start=1):
+            ws.cell(row=row_num, column=col_num).value = cell
+            ws.cell(row=row_num, column=col_num).font = Font(name=font_face)
+            ws.cell(row=row_num, column=col_num).number_format = Querier._EXCEL_FORMATS.get(type(cell))
+
+    ws.auto_filter.ref = ws.dimensions
+    ws.freeze_panes = 'A2'
+    wb.save(fou)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark Querier.save_excel on a large query result.')
+    parser.add_argument('--rows', type=int, default=500000, help='the number of rows of the query result')
+    parser.add_argument('--max-rows', type=int, default=LowQuerier.EXCEL_MAX_ROWS,
+                        help='the maximum number of rows for each sheet')
+    parser.add_argument('--skip-baseline', action='store_true',
+                        help='skip the old path, that keeps the whole workbook in memory')
+    args = parser.parse_args()
+
+    paths = {'save_excel': lambda querier, fou: querier.save_excel(fou, sheet_name='bench', max_rows=args.max_rows)}
+    # the old path runs last, since the peak resident memory of the process can only grow
+    if not args.skip_baseline: paths['baseline'] = lambda querier, fou: legacy_save_excel(querier, fou, 'bench')
+
+    results, rss_before = {}, peak_rss()
+    with tempfile.TemporaryDirectory() as tmp, LowQuerier() as querier:
+        for name, func in paths.items():
+            fou = Path(tmp) / f'{name}.xlsx'
+            begin = perf_counter()
+            querier.run(QUERY_ROWS, args.rows)
+            func(querier, fou)
+            results[name] = (perf_counter() - begin, fou.stat().st_size, peak_rss())
+
+    print(f'rows {args.rows:,}' + (f', peak RSS before export {rss_before:.1f} MB' if rss_before is not None else ''))
+    # the speedup of each path is against the old one, or against itself if the old one is skipped
+    reference = results.get('baseline', results['save_excel'])[0]
+    for name, (elapsed, size, rss) in results.items():
+        print(f'{name:<12} {elapsed:8.3f} s  {args.rows / elapsed:>9,.0f} rows/s  {size / 1024 / 1024:6.1f} MB file'
+              + (f'  {rss:7.1f} MB peak RSS' if rss is not None else '') + f'  x{reference / elapsed:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Benchmark the conversion of tolling details retrieved from API call into the insert query parameters,
+by comparing the old path, a plain dataclass built by keywords and copied by astuple,
+with the new one, the slotted Toll built by Toll.from_items and read by Toll.params.
+
+    python bench/bench_toll_records.py --items 100000
+"""
+import argparse
+import random
+import sys
+import uuid
+from dataclasses import astuple, dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from feenox.recording_fees import Toll
+
+
+@dataclass
+class LegacyToll:
+    """
+    The LegacyToll object is the Toll object before the slotted records, with the global identifier always generated.
+    """
+    id: str
+    toll_country: str
+    toll_group: str
+    toll_genre: str
+    toll_source: str | None
+    acquisition_date: datetime
+    customer_code: str
+    contract_code: str
+    sign_of_transaction: str
+    net_amount: Decimal
+    gross_amount: Decimal
+    vat_rate: Decimal
+    currency_code: str
+    exchange_rate: Decimal | None
+    network_code: str | None
+    entry_gate_code: str | None
+    entry_gate_description: str | None
+    entry_date: datetime | None
+    exit_gate_code: str
+    exit_gate_description: str
+    exit_date: datetime
+    distance: Decimal | None
+    device_type: str
+    device_serial_number: str
+    device_service_pan: str | None
+    vehicle_plate: str
+    vehicle_country: str
+    vehicle_euro_class: str | None
+    tariff_class: str | None
+    invoice_article: str | None
+    invoice_number: str | None
+    invoice_date: datetime | None
+    global_identifier: str = field(init=False)
+    recording_date: datetime
+
+    def __post_init__(self) -> None:
+        self.global_identifier = '#'.join(
+            var.strftime('%Y%m%d%H%M%S')
+            if isinstance(var, datetime)
+            else str(var.quantize(Decimal('1e-5'))).replace('.', '').rjust(11, '0')
+            if isinstance(var, Decimal)
+            else str(var)
+            for var in (
+                self.toll_group,
+                self.toll_genre,
+                self.acquisition_date,
+                self.customer_code,
+                self.contract_code,
+                self.sign_of_transaction,
+                self.net_amount,
+                self.gross_amount,
+                self.vat_rate,
+                self.exchange_rate,
+                self.network_code,
+                self.entry_gate_code,
+                self.entry_date,
+                self.exit_gate_code,
+                self.exit_date,
+                self.device_serial_number,
+                self.device_service_pan,
+                self.invoice_number,
+                self.invoice_date
+            ) if var is not None
+        )
+
+
+def legacy_params(item: dict[str, Any],
+                  toll_genre: str,
+                  recording_date: datetime) -> tuple:
+    """
+    Convert a tolling detail into the insert query parameters, as done before the slotted records.
+    """
+    toll = LegacyToll(
+        id=item['id'],
+        toll_country=item['nation'],
+        toll_group=item['toll_group_code'],
+        toll_genre=item['type'],
+        toll_source=item['filename'] if toll_genre == 'P' else None,
+        acquisition_date=datetime.fromisoformat(item['acquisition_date']),
+        customer_code=item['customer_code'],
+        contract_code=item['contract_code'],
+        sign_of_transaction=item['sign_of_transaction'],
+        net_amount=Decimal(str(item['amount_no_vat'])),
+        gross_amount=Decimal(str(item['amount_including_vat'])),
+        vat_rate=Decimal(str(item['vat'])),
+        currency_code=item['currency_code'],
+        exchange_rate=Decimal(str(item['exchange_rate'])) if item['exchange_rate'] else None,
+        network_code=item['network_code'],
+        entry_gate_code=item['entry_global_gate_identifier'],
+        entry_gate_description=item['entry_global_gate_identifier_description'],
+        entry_date=(datetime.fromisoformat(item['entry_timestamp']) if item['entry_timestamp'] else None),
+        exit_gate_code=item['exit_global_gate_identifier'],
+        exit_gate_description=item['exit_global_gate_identifier_description'],
+        exit_date=datetime.fromisoformat(item['exit_timestamp']),
+        distance=Decimal(str(item['km'])) if item['km'] else None,
+        device_type=item['device_type'],
+        device_serial_number=item['obu'],
+        device_service_pan=item['pan_number'],
+        vehicle_plate=item['vehicle_plate'],
+        vehicle_country=item['vehicle_country'],
+        vehicle_euro_class=item['vehicle_euro_class'],
+        tariff_class=item['vehicle_tariff_class'],
+        invoice_article=item['invoice_article'] if toll_genre == 'D' else None,
+        invoice_number=item['invoice_nr'] if toll_genre == 'D' else None,
+        invoice_date=(datetime.fromisoformat(item['invoice_date']) if toll_genre == 'D' else None),
+        recording_date=recording_date
+    )
+    return astuple(toll)
+
+
+def make_items(size: int,
+               toll_genre: str,
+               seed: int = 0) -> list[dict[str, Any]]:
+    """
+    Generate synthetic tolling details, shaped as the ones retrieved from API call.
+    """
+    rnd, day = random.Random(seed), datetime(2025, 1, 1)
+    items = []
+    for _ in range(size):
+        acquisition = day + timedelta(seconds=rnd.randrange(90 * 86400))
+        exit_timestamp = acquisition - timedelta(seconds=rnd.randrange(2 * 86400))
+        amount = round(rnd.uniform(1, 100), 2)
+        items.append({
+            'id': str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            'nation': 'IT',
+            'toll_group_code': f'G{rnd.randint(1, 5):02d}',
+            'type': toll_genre,
+            'filename': 'tolls.txt',
+            'acquisition_date': acquisition.isoformat(),
+            'customer_code': f'C{rnd.randint(1, 10):03d}',
+            'contract_code': f'K{rnd.randint(1, 20):03d}',
+            'sign_of_transaction': rnd.choice('+-'),
+            'amount_no_vat': amount,
+            'amount_including_vat': round(amount * 1.22, 2),
+            'vat': 22,
+            'currency_code': 'EUR',
+            'exchange_rate': rnd.choice([None, 1.12345]),
+            'network_code': rnd.choice([None, 'N1']),
+            'entry_global_gate_identifier': f'GT{rnd.randint(1, 500):04d}',
+            'entry_global_gate_identifier_description': 'entry gate',
+            'entry_timestamp': rnd.choice(['', (exit_timestamp - timedelta(hours=1)).isoformat()]),
+            'exit_global_gate_identifier': f'GT{rnd.randint(1, 500):04d}',
+            'exit_global_gate_identifier_description': 'exit gate',
+            'exit_timestamp': exit_timestamp.isoformat(),
+            'km': rnd.choice([None, round(rnd.uniform(1, 300), 1)]),
+            'device_type': 'OBU',
+            'obu': f'{rnd.randrange(10 ** 12):012d}',
+            'pan_number': rnd.choice([None, 'P1']),
+            'vehicle_plate': 'AB123CD',
+            'vehicle_country': 'IT',
+            'vehicle_euro_class': 'EURO6',
+            'vehicle_tariff_class': 'A',
+            'invoice_article': 'PEDAGGI',
+            'invoice_nr': 'INV1',
+            'invoice_date': (acquisition + timedelta(days=3)).isoformat()
+        })
+    return items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the toll records conversion, old against new path.')
+    parser.add_argument('--items', type=int, default=100000, help='the number of synthetic tolling details')
+    parser.add_argument('--genre', default='D', choices=('D', 'P'), help='the toll genre of the tolling details')
+    parser.add_argument('--repeat', type=int, default=3, help='the runs of each path, the best one is reported')
+    args = parser.parse_args()
+
+    items, recording_date = make_items(args.items, args.genre), datetime.now()
+    paths = {
+        'astuple(Toll(**kw))': lambda: [legacy_params(item, args.genre, recording_date) for item in items],
+        'Toll.from_items + params': lambda: [toll.params() for toll in Toll.from_items(items, args.genre, recording_date)]
+    }
+
+    results, res = {}, {}
+    for name, func in paths.items():
+        best = float('inf')
+        for _ in range(args.repeat):
+            begin = perf_counter()
+            res[name] = func()
+            best = min(best, perf_counter() - begin)
+        results[name] = best
+
+    # both paths must produce the same parameters, global identifier included
+    old, new = res.values()
+    if old != new: sys.exit('the two paths produce different parameters!')
+
+    baseline = results['astuple(Toll(**kw))']
+    for name, seconds in results.items():
+        print(f'{name:<28} {seconds:8.3f} s  {args.items / seconds:>10,.0f} items/s  x{baseline / seconds:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -69,6 +69,35 @@ CREATE UNIQUE INDEX idx_toll_global_identifier
     ON feenox.toll (global_identifier)
 ;
 
+CREATE INDEX idx_toll_toll_genre_exit_date
+    ON feenox.toll (toll_genre, exit_date)
+;
+
+CREATE INDEX idx_toll_toll_genre_acquisition_date
+    ON feenox.toll (toll_genre, acquisition_date)
+;
+
+CREATE INDEX idx_toll_toll_genre_recording_date
+    ON feenox.toll (toll_genre, recording_date)
+;
+
+CREATE TABLE IF NOT EXISTS feenox.toll_checkpoint (
+    toll_genre CHAR(1) NOT NULL,
+    date_type VARCHAR(255) NOT NULL,
+    date_from DATE NOT NULL,
+    date_to DATE NOT NULL,
+    nr_tolls INTEGER NOT NULL,
+    nr_duplicates INTEGER NOT NULL DEFAULT 0,
+    recording_date TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT pk_toll_checkpoint
+        PRIMARY KEY (toll_genre, date_type),
+    CONSTRAINT chk_toll_checkpoint_date_type
+        CHECK (date_type IN ('tolls', 'acquisition', 'invoice')),
+    CONSTRAINT chk_toll_checkpoint_date_to
+        CHECK (date_to >= date_from)
+)
+;
+
 CREATE TABLE IF NOT EXISTS feenox.document (
     id CHAR(36) NOT NULL,
     customer_code VARCHAR(255) NOT NULL,
@@ -90,6 +119,31 @@ CREATE UNIQUE INDEX idx_document_filename
     ON feenox.document (filename)
 ;
 
+CREATE TABLE IF NOT EXISTS feenox.document_checkpoint (
+    document_type VARCHAR(255) NOT NULL,
+    publication_date DATE NOT NULL,
+    recording_date TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT pk_document_checkpoint
+        PRIMARY KEY (document_type)
+)
+;
+
+CREATE TABLE IF NOT EXISTS feenox.document_failure (
+    id CHAR(36) NOT NULL,
+    document_type VARCHAR(255) NOT NULL,
+    customer_code VARCHAR(255) NOT NULL,
+    document_date DATE NOT NULL,
+    publication_date DATE NOT NULL,
+    nr_failures INTEGER NOT NULL DEFAULT 1,
+    last_error TEXT,
+    recording_date TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT pk_document_failure
+        PRIMARY KEY (id),
+    CONSTRAINT chk_document_failure_nr_failures
+        CHECK (nr_failures > 0)
+)
+;
+
 REVOKE ALL PRIVILEGES ON ALL TABLES IN SCHEMA feenox FROM feenox;
 ALTER DEFAULT PRIVILEGES IN SCHEMA feenox REVOKE SELECT, INSERT, UPDATE ON TABLES FROM feenox;
 REVOKE ALL PRIVILEGES ON ALL FUNCTIONS IN SCHEMA feenox FROM feenox;
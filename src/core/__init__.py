@@ -1,4 +1,5 @@
-from .common import decode_json, get_logger
-from .querier import LowQuerier, Querier
+from .common import decode_json, get_logger, write_atomic
+from .metrics import Metrics, metrics
+from .querier import LowQuerier, Querier, QuerierPool, StatementStats
 
 __version__ = '1.0.3'
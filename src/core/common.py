@@ -1,5 +1,6 @@
 import json
 import logging
+import os
 from datetime import date
 from pathlib import Path
 
@@ -35,6 +36,24 @@ def decode_json(json_in: str | Path,
     return res[0] if res and single else res if res else None
 
 
+def write_atomic(fou: str | Path,
+                 text: str) -> None:
+    """
+    Write a text file by replacing it atomically, through a temporary file in the same folder,
+    so that the readers of the file never find it partially written.
+
+    :param fou: The path to the result file, including filename.
+    :type fou: str | Path
+    :param text: The content of the file.
+    :type text: str
+    """
+    fou = Path(fou).resolve()
+    tmp = fou.with_name(f'{fou.name}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as tou:
+        tou.write(text)
+    os.replace(tmp, fou)
+
+
 def get_logger(fou: str | Path,
                name: str = 'main',
                level: str = 'INFO',
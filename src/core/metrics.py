@@ -0,0 +1,196 @@
+import json
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+from .common import write_atomic
+
+
+@dataclass(slots=True)
+class TimerStats:
+    """
+    The TimerStats object collects the durations of an operation, with the number of items processed.
+    """
+    calls: int = 0
+    seconds: float = 0.0
+    min: float = 0.0
+    max: float = 0.0
+    items: int = 0
+
+    def add(self,
+            seconds: float,
+            items: int = 0) -> None:
+        """
+        Add a duration of the operation.
+
+        :param seconds: The seconds spent by the operation.
+        :type seconds: float
+        :param items: The number of items processed by the operation, defaults to 0.
+        :type items: int
+        """
+        self.min = min(self.min, seconds) if self.calls else seconds
+        self.max = max(self.max, seconds)
+        self.calls += 1
+        self.seconds += seconds
+        self.items += items
+
+
+class Metrics:
+    """
+    The Metrics object collects counters and timers during a job, to be saved as a JSON or Prometheus summary.
+    Each metric is identified by its name and labels, and can be updated concurrently by more threads.
+    """
+    def __init__(self,
+                 prefix: str = 'feenox') -> None:
+        """
+        Initialize an empty collection of metrics.
+
+        :param prefix: The prefix of the metric names in the Prometheus summary, defaults to 'feenox'.
+        :type prefix: str
+        """
+        self.prefix: str = prefix
+        self.begin: datetime = datetime.now()
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._timers: dict[tuple[str, tuple], TimerStats] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def count(self,
+              name: str,
+              value: float = 1,
+              **labels) -> None:
+        """
+        Increment a counter.
+
+        :param name: The name of the counter.
+        :type name: str
+        :param value: The value to be added to the counter, defaults to 1.
+        :type value: float
+        :param labels: The labels of the counter as key=value.
+        :type labels: Any
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self,
+                name: str,
+                seconds: float,
+                items: int = 0,
+                **labels) -> None:
+        """
+        Add a duration to a timer.
+
+        :param name: The name of the timer.
+        :type name: str
+        :param seconds: The seconds spent by the operation.
+        :type seconds: float
+        :param items: The number of items processed by the operation, defaults to 0.
+        :type items: int
+        :param labels: The labels of the timer as key=value.
+        :type labels: Any
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if (stats := self._timers.get(key)) is None:
+                stats = self._timers[key] = TimerStats()
+            stats.add(seconds, items)
+
+    @contextmanager
+    def timer(self,
+              name: str,
+              items: int = 0,
+              **labels) -> Iterator[None]:
+        """
+        Measure the duration of the operation in the context, which is added to a timer even if it raises error.
+
+        :param name: The name of the timer.
+        :type name: str
+        :param items: The number of items processed by the operation, defaults to 0.
+        :type items: int
+        :param labels: The labels of the timer as key=value.
+        :type labels: Any
+        :return: The context in which the duration is measured.
+        :rtype: Iterator[None]
+        """
+        begin = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - begin, items, **labels)
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Get all the metrics collected, with the throughput of the timers that processed items.
+
+        :return: A dictionary with the job begin and elapsed time, the counters and the timers.
+        :rtype: dict[str, Any]
+        """
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self._counters.items()
+            ]
+            timers = [
+                {'name': name, 'labels': dict(labels), **asdict(stats),
+                 'items_per_second': stats.items / stats.seconds if stats.items and stats.seconds else None}
+                for (name, labels), stats in self._timers.items()
+            ]
+        return {
+            'begin': self.begin.isoformat(),
+            'elapsed': (datetime.now() - self.begin).total_seconds(),
+            'counters': counters,
+            'timers': timers
+        }
+
+    def save_json(self,
+                  fou: str | Path) -> None:
+        """
+        Save the summary of the metrics into a JSON file.
+
+        :param fou: The path to the result file, including filename.
+        :type fou: str | Path
+        """
+        write_atomic(fou, json.dumps(self.summary(), indent=2))
+
+    def save_prometheus(self,
+                        fou: str | Path) -> None:
+        """
+        Save the summary of the metrics into a file in Prometheus text format.
+        The counters are saved with the _total suffix and the timers as summaries of seconds with their items count.
+
+        :param fou: The path to the result file, including filename.
+        :type fou: str | Path
+        """
+        def format_labels(labels: dict[str, Any]) -> str:
+            if not labels: return ''
+            # the backslashes and the double quotes must be escaped in the label values
+            values = {key: str(value).replace('\\', '\\\\').replace('"', '\\"') for key, value in labels.items()}
+            return '{' + ','.join(f'{key}="{value}"' for key, value in values.items()) + '}'
+
+        # the lines of each metric must be grouped together under their type
+        summary, groups = self.summary(), {}
+        for counter in summary['counters']:
+            name = f"{self.prefix}_{counter['name']}_total"
+            groups.setdefault((name, 'counter'), []).append(f"{name}{format_labels(counter['labels'])} {counter['value']}")
+        for timer in summary['timers']:
+            name, labels = f"{self.prefix}_{timer['name']}_seconds", format_labels(timer['labels'])
+            groups.setdefault((name, 'summary'), []).extend([
+                f"{name}_count{labels} {timer['calls']}",
+                f"{name}_sum{labels} {timer['seconds']}"
+            ])
+            if timer['items']:
+                name = f"{self.prefix}_{timer['name']}_items_total"
+                groups.setdefault((name, 'counter'), []).append(f"{name}{labels} {timer['items']}")
+        groups[f'{self.prefix}_job_elapsed_seconds', 'gauge'] = [f"{self.prefix}_job_elapsed_seconds {summary['elapsed']}"]
+
+        lines = [line for (name, genre), group in groups.items() for line in (f'# TYPE {name} {genre}', *group)]
+        write_atomic(fou, '\n'.join(lines) + '\n')
+
+
+# metrics: the metrics shared by all the modules during the job
+metrics: Metrics = Metrics()
@@ -1,15 +1,51 @@
+import csv
+import json
 import sqlite3
+import threading
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import date, datetime, time
 from decimal import Decimal
+from itertools import islice
 from pathlib import Path
-from typing import Any, Self
-
-import openpyxl
-import pyodbc
-from openpyxl.styles import Font
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Any, Self
 
 from .common import decode_json
 
+# pyodbc and openpyxl are imported only when needed, to keep fast the import of the package
+if TYPE_CHECKING:
+    import pyodbc
+
+
+@dataclass(slots=True)
+class StatementStats:
+    """
+    The StatementStats object collects the executions of a query string on the database, across all connections.
+    """
+    calls: int = 0
+    # hits: the number of executions done on an already prepared cursor
+    hits: int = 0
+    # elapsed: the total seconds spent by the executions
+    elapsed: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The rate of executions done on an already prepared cursor, between 0 and 1.
+        """
+        return self.hits / self.calls if self.calls else 0.0
+
+    @property
+    def latency(self) -> float:
+        """
+        The average seconds spent by an execution.
+        """
+        return self.elapsed / self.calls if self.calls else 0.0
+
 
 class Querier:
     """
@@ -17,12 +53,22 @@ class Querier:
     """
     # _cache_config: save in cache the database connection info to be reuse quickly during same run
     _cache_config: dict[str, dict] = {}
+    # _stats: the execution stats of each query string run during the job, shared by all connections
+    _stats: dict[str, StatementStats] = {}
+    _stats_lock: threading.Lock = threading.Lock()
 
     FETCH_VAL: int = 10
     FETCH_ONE: int = 20
     FETCH_ALL: int = 30
     FETCH_MANY: int = 40
 
+    STREAM_ROWS: int = 50
+    STREAM_NAMED: int = 60
+    STREAM_COLUMNS: int = 70
+
+    # EXCEL_MAX_ROWS: the maximum number of rows of an Excel sheet
+    EXCEL_MAX_ROWS: int = 1048576
+
     _EXCEL_FORMATS: dict = {
         type(None): 'General',
         str: '@',
@@ -31,16 +77,27 @@ class Querier:
         Decimal: '#,##0.00',
         date: 'dd/mm/yyyy',
         time: 'h:mm:ss;@',
-        datetime: 'dd/mm/yyyy h:mm:ss;@'
+        datetime: 'dd/mm/yyyy h:mm:ss;@',
+        bytes: '@'
     }
+    # _EXPORT_DECODERS: convert back the text saved by _encode for the types in _EXCEL_FORMATS not supported by JSON,
+    # by their ISO format or by their hex digits
+    _EXPORT_DECODERS: dict = {
+        genre.__name__: getattr(genre, 'fromisoformat', None) or getattr(genre, 'fromhex', genre)
+        for genre in _EXCEL_FORMATS if genre not in (type(None), str, int, float)
+    }
+    # COLUMNAR_MAGIC: the leading bytes of the files saved by save_columnar
+    COLUMNAR_MAGIC: bytes = b'FNXC\x01'
 
     def __init__(self,
                  cfg_in: str | Path = None,
                  conn_name: str = 'main',
                  conn_str: dict = None,
-                 save_changes: bool = False) -> None:
+                 save_changes: bool = False,
+                 cache_size: int = 32) -> None:
         """
         Read from a JSON config file the database configuration and start the connection.
+        Each query string is run on its own cursor, kept in cache to let the driver reuse the prepared statement.
 
         :param cfg_in: The path to the JSON file with the database configurations, defaults to None.
         :type cfg_in: str | Path
@@ -50,8 +107,14 @@ class Querier:
         :type conn_str: dict
         :param save_changes: Enable or disable the auto-commit, defaults to False.
         :type save_changes: bool
+        :param cache_size: The maximum number of cursors kept in cache, one for each query string, defaults to 32.
+        :type cache_size: int
         :raise IOError: If configuration is not found.
         """
+        # _statements: the cursors in cache by query string, from the least to the most recently used
+        self._statements: OrderedDict[str, pyodbc.Cursor] = OrderedDict()
+        self.cache_size: int = cache_size
+
         if not conn_str and cfg_in:
             cfg_in = Path(cfg_in).resolve()
 
@@ -71,6 +134,8 @@ class Querier:
         elif conn_str: config = conn_str
         else: raise IOError('Querier: no config found!')
 
+        import pyodbc
+
         self._connection: pyodbc.Connection = pyodbc.connect(
             driver=f"{{{config['driver']}}}",
             server=config['server'],
@@ -78,24 +143,67 @@ class Querier:
             database=config['database'],
             user=config['user'],
             password=config['password'],
-            autocommit=save_changes
+            autocommit=save_changes,
+            # further driver specific connection attributes, as UseDeclareFetch and Fetch for PostgreSQL cursors
+            **config.get('options', {})
         )
         self._cursor: pyodbc.Cursor = self._connection.cursor()
         # rows: contains the number of resultset rows after each query run
         self.rows: int = 0
+        # batch_rows: contains the number of written rows for each batch after each bulk query run
+        self.batch_rows: list[int] = []
 
     def __del__(self) -> None:
-        self._cursor.close()
-        self._connection.close()
+        self.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
-    def __iter__(self) -> pyodbc.Cursor:
+    def close(self) -> None:
+        """
+        Close the cursor and the connection to the database, if not already closed.
+        """
+        if getattr(self, '_connection', None) is None: return
+        try:
+            # closing the connection closes also all the cursors in cache
+            self._connection.close()
+        except Exception:
+            # the connection could be already broken, so nothing else to be closed
+            pass
+        self._cursor, self._connection = None, None
+        self._statements.clear()
+
+    def is_alive(self) -> bool:
+        """
+        Check if the connection to the database is still working, by running a trivial query.
+        The query runs on a throwaway cursor, so it doesn't take a place in the cursor cache nor in the query stats.
+
+        :return: True if the connection works, False otherwise.
+        :rtype: bool
+        """
+        if getattr(self, '_connection', None) is None: return False
+        try:
+            # the cursor isn't used as context manager, as exiting it would commit the pending changes
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute('SELECT 1').fetchval()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def __iter__(self) -> 'pyodbc.Cursor':
         """
         Exposes the cursor to loop directly on the object itself.
         """
         return self._cursor
 
     @property
-    def cursor(self) -> pyodbc.Cursor:
+    def cursor(self) -> 'pyodbc.Cursor':
         """
         Exposes the cursor to make available further calls not wrapped in this class.
 
@@ -104,6 +212,57 @@ class Querier:
         """
         return self._cursor
 
+    @classmethod
+    def statement_stats(cls) -> dict[str, StatementStats]:
+        """
+        Get the execution stats of each query string run on the database, by all the connections.
+
+        :return: The stats by query string.
+        :rtype: dict[str, StatementStats]
+        """
+        with cls._stats_lock:
+            return {query: StatementStats(stats.calls, stats.hits, stats.elapsed) for query, stats in cls._stats.items()}
+
+    def _prepare(self,
+                 query: str) -> bool:
+        """
+        Make current the cursor in cache for the query string, by creating it if not already there.
+        The least recently used cursor is closed when the cache exceeds its size.
+
+        :param query: The query string to be executed.
+        :type query: str
+        :return: True if the cursor was already in cache, False otherwise.
+        :rtype: bool
+        """
+        if hit := (cursor := self._statements.get(query)) is not None:
+            self._statements.move_to_end(query)
+        else:
+            cursor = self._statements[query] = self._connection.cursor()
+            if len(self._statements) > self.cache_size:
+                self._statements.popitem(last=False)[1].close()
+        self._cursor = cursor
+        return hit
+
+    @staticmethod
+    def _record(query: str,
+                hit: bool,
+                elapsed: float) -> None:
+        """
+        Add an execution to the stats of the query string.
+
+        :param query: The query string executed.
+        :type query: str
+        :param hit: True if the execution was done on a cursor in cache.
+        :type hit: bool
+        :param elapsed: The seconds spent by the execution.
+        :type elapsed: float
+        """
+        with Querier._stats_lock:
+            stats = Querier._stats.setdefault(query, StatementStats())
+            stats.calls += 1
+            stats.hits += hit
+            stats.elapsed += elapsed
+
     def run(self,
             query: str,
             *args) -> Self:
@@ -117,11 +276,56 @@ class Querier:
         :return: The object itself, so that calls can be chained.
         :rtype: Querier
         """
-        self.rows = (
-            self._cursor.execute(query, *args).rowcount
-            if args and any(val is not None for val in args)
-            else self._cursor.execute(query).rowcount
-        )
+        hit, begin = self._prepare(query), perf_counter()
+        self.rows = (self._cursor.execute(query, *args) if args else self._cursor.execute(query)).rowcount
+        Querier._record(query, hit, perf_counter() - begin)
+        return self
+
+    def run_many(self,
+                 query: str,
+                 params: Iterable[Sequence],
+                 batch_size: int = 1000,
+                 fast: bool = True) -> Self:
+        """
+        Execute a DML query on the database for each parameters tuple, by sending them in batches.
+        Each batch is saved with a single commit, or reverted entirely if an error occurs.
+
+        :param query: The query string to be executed.
+        :type query: str
+        :param params: The iterable of parameters tuples of the query string, one for each execution.
+        :type params: Iterable[Sequence]
+        :param batch_size: The number of parameters tuples sent for each batch, defaults to 1000.
+        :type batch_size: int
+        :param fast: Enable or disable the pyodbc fast_executemany, where supported, defaults to True.
+        :type fast: bool
+        :return: The object itself, so that calls can be chained.
+        :rtype: Querier
+        """
+        hit = self._prepare(query)
+        if hasattr(self._cursor, 'fast_executemany'):
+            self._cursor.fast_executemany = fast
+        # autocommit must be disabled to save each batch in a single commit
+        autocommit = getattr(self._connection, 'autocommit', None) is True
+        if autocommit: self._connection.autocommit = False
+
+        self.rows, self.batch_rows = 0, []
+        params = iter(params)
+        try:
+            while batch := list(islice(params, batch_size)):
+                begin = perf_counter()
+                try:
+                    self._cursor.executemany(query, batch)
+                    self._connection.commit()
+                except Exception:
+                    self._connection.rollback()
+                    raise
+                # each batch is a round trip to the database, the following ones reuse the statement of the first
+                Querier._record(query, hit or bool(self.batch_rows), perf_counter() - begin)
+                # the rowcount is not reliable for bulk executions, but a batch is saved entirely or raise error
+                self.batch_rows.append(len(batch))
+                self.rows += len(batch)
+        finally:
+            if autocommit: self._connection.autocommit = True
         return self
 
     def fetch(self,
@@ -149,6 +353,39 @@ class Querier:
             case _:
                 return None
 
+    def stream(self,
+               genre: int = STREAM_NAMED,
+               size: int = 1000) -> Iterator[list | dict[str, list]]:
+        """
+        Iterate on the last query result in batches based on stream genre STREAM_ROWS, STREAM_NAMED or STREAM_COLUMNS,
+        without loading the whole result set in memory.
+        The STREAM_ROWS genre yields the driver rows, the STREAM_NAMED genre yields named tuples
+        and the STREAM_COLUMNS genre yields a dictionary with a list of values for each column.
+
+        :param genre: The class constant stream genre, defaults to STREAM_NAMED.
+        :type genre: int
+        :param size: The number of rows for each batch, defaults to 1000.
+        :type size: int
+        :return: An iterator of the batches of the query result set.
+        :rtype: Iterator[list | dict[str, list]]
+        """
+        if not (header := self.row_header()): return
+        # the named tuple class is created once for all rows, renaming columns that are not valid identifiers
+        row_type = namedtuple('Row', header, rename=True) if genre == Querier.STREAM_NAMED else None
+
+        # the cursor is bound at start, so that other queries can be run while iterating
+        cursor = self._cursor
+        while rows := cursor.fetchmany(size):
+            match genre:
+                case Querier.STREAM_ROWS:
+                    yield rows
+                case Querier.STREAM_NAMED:
+                    yield list(map(row_type._make, rows))
+                case Querier.STREAM_COLUMNS:
+                    yield dict(zip(header, map(list, zip(*rows))))
+                case _:
+                    return
+
     def save_changes(self,
                      save: bool = True) -> None:
         """
@@ -174,9 +411,12 @@ class Querier:
     def save_excel(self,
                    fou: str | Path,
                    sheet_name: str = None,
-                   font_face: str = None) -> None:
+                   font_face: str = None,
+                   max_rows: int = EXCEL_MAX_ROWS) -> None:
         """
-        Save the last query result into an Excel file.
+        Save the last query result into an Excel file, by streaming the rows without keeping them in memory.
+        The number format of each column is got from the data type of its first value not NULL,
+        and the result is split in more sheets if it exceeds the maximum number of rows of a sheet.
 
         :param fou: The path to the result file, including filename.
         :type fou: str | Path
@@ -184,28 +424,187 @@ class Querier:
         :type sheet_name: str
         :param font_face: The font name to be used into the file, defaults to Excel defaults font family.
         :type font_face: str
+        :param max_rows: The maximum number of rows for each sheet, including the header, defaults to EXCEL_MAX_ROWS.
+        :type max_rows: int
         """
-        if self._cursor:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            if sheet_name: ws.title = sheet_name
-
-            # write columns header in bold font from the columns name in the cursor
-            for col_num, cell in enumerate(self.row_header(), start=1):
-                ws.cell(row=1, column=col_num).value = cell
-                ws.cell(row=1, column=col_num).font = Font(name=font_face, bold=True)
-                ws.cell(row=1, column=col_num).number_format = Querier._EXCEL_FORMATS.get(type(cell))
-
-            # write all columns data with their specific data types
-            for row_num, row in enumerate(self._cursor, start=2):
-                for col_num, cell in enumerate(row, start=1):
-                    ws.cell(row=row_num, column=col_num).value = cell
-                    ws.cell(row=row_num, column=col_num).font = Font(name=font_face)
-                    ws.cell(row=row_num, column=col_num).number_format = Querier._EXCEL_FORMATS.get(type(cell))
-
-            ws.auto_filter.ref = ws.dimensions
+        if not self._cursor or not (header := self.row_header()): return
+
+        import openpyxl
+        from openpyxl.cell import Cell, WriteOnlyCell
+        from openpyxl.styles import Font, NamedStyle
+        from openpyxl.utils import get_column_letter
+        from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+
+        wb = openpyxl.Workbook(write_only=True)
+        # the styles are registered once in the workbook and shared by all cells, instead of a style for each cell
+        wb.add_named_style(NamedStyle('header', font=Font(name=font_face, bold=True),
+                                      number_format=Querier._EXCEL_FORMATS[str]))
+        # styles: the style of each column, None until its first value not NULL is found
+        styles: list[str | None] = [None] * len(header)
+
+        def new_style(value: Any) -> str:
+            number_format = Querier._EXCEL_FORMATS.get(type(value), 'General')
+            if (style := f'data {number_format}') not in wb.named_styles:
+                wb.add_named_style(NamedStyle(style, font=Font(name=font_face), number_format=number_format))
+            return style
+
+        def new_cell(ws: WriteOnlyWorksheet, style: str, value: Any = None) -> Cell:
+            # the style is set before the value, so that a date format is kept as the date value is bound
+            cell = WriteOnlyCell(ws)
+            cell.style = style
+            cell.value = value
+            return cell
+
+        def new_sheet(nr_sheet: int) -> tuple[WriteOnlyWorksheet, list[Cell | None]]:
+            title = sheet_name or 'Sheet'
+            # the sheet title can't be longer than 31 characters
+            ws = wb.create_sheet(title if nr_sheet == 1 else f'{title[:25]} ({nr_sheet})')
             ws.freeze_panes = 'A2'
-            wb.save(fou)
+            ws.append([new_cell(ws, 'header', cell) for cell in header])
+            # a single styled cell is reused for all values of a column, since each row is written as soon as appended
+            return ws, [new_cell(ws, style) if style else None for style in styles]
+
+        (ws, cells), nr_sheet, nr_row = new_sheet(1), 1, 1
+        for row in self._cursor:
+            if nr_row == max_rows:
+                ws.auto_filter.ref = f'A1:{get_column_letter(len(header))}{nr_row}'
+                nr_sheet += 1
+                (ws, cells), nr_row = new_sheet(nr_sheet), 1
+            values = []
+            for nr_column, value in enumerate(row):
+                # the empty cells are skipped without style, as done by Excel
+                if value is not None:
+                    if (cell := cells[nr_column]) is None:
+                        styles[nr_column] = new_style(value)
+                        cell = cells[nr_column] = new_cell(ws, styles[nr_column])
+                    cell.value = value
+                    value = cell
+                values.append(value)
+            ws.append(values)
+            nr_row += 1
+        ws.auto_filter.ref = f'A1:{get_column_letter(len(header))}{nr_row}'
+        wb.save(fou)
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        """
+        Convert a value into text, as saved by all the exports: the date and time values by their ISO format,
+        the bytes by their hex digits and the others by their string, so that _EXPORT_DECODERS can convert them back.
+        It's used as default function of the JSON encoder, for the values not supported by JSON.
+
+        :param value: The value to be converted.
+        :type value: Any
+        :return: The value converted into text.
+        :rtype: str
+        """
+        if isoformat := getattr(value, 'isoformat', None): return isoformat()
+        return value.hex() if isinstance(value, bytes) else str(value)
+
+    def save_csv(self,
+                 fou: str | Path,
+                 delimiter: str = ',',
+                 size: int = 1000) -> None:
+        """
+        Save the last query result into a CSV file, by streaming the rows in batches.
+        The values are saved as text as done by the other exports, while the empty values are saved as empty fields.
+
+        :param fou: The path to the result file, including filename.
+        :type fou: str | Path
+        :param delimiter: The character used to separate the fields, defaults to ','.
+        :type delimiter: str
+        :param size: The number of rows fetched and written for each batch, defaults to 1000.
+        :type size: int
+        """
+        if not self._cursor or not (header := self.row_header()): return
+
+        with open(fou, 'w', encoding='utf-8', newline='') as cou:
+            writer = csv.writer(cou, delimiter=delimiter)
+            writer.writerow(header)
+            for rows in self.stream(Querier.STREAM_ROWS, size):
+                writer.writerows([Querier._encode(var) if var is not None else None for var in row] for row in rows)
+
+    def save_jsonl(self,
+                   fou: str | Path,
+                   size: int = 1000) -> None:
+        """
+        Save the last query result into a JSON Lines file, with an object for each row, by streaming the rows in batches.
+        The decimal, date, time and bytes values are saved as text.
+
+        :param fou: The path to the result file, including filename.
+        :type fou: str | Path
+        :param size: The number of rows fetched and written for each batch, defaults to 1000.
+        :type size: int
+        """
+        if not self._cursor or not (header := self.row_header()): return
+
+        with open(fou, 'w', encoding='utf-8') as jou:
+            for rows in self.stream(Querier.STREAM_ROWS, size):
+                jou.writelines(
+                    f"{json.dumps(dict(zip(header, row)), default=Querier._encode)}\n"
+                    for row in rows
+                )
+
+    def save_columnar(self,
+                      fou: str | Path,
+                      size: int = 10000,
+                      level: int = 6) -> None:
+        """
+        Save the last query result into a binary columnar file, by streaming the rows in batches.
+        The file starts with the COLUMNAR_MAGIC bytes followed by frames, each one made by its length in 4 bytes
+        and a zlib compressed JSON object: the first frame has the column names,
+        the following ones have the column values of a batch of rows with the column types, as named in _EXCEL_FORMATS.
+
+        :param fou: The path to the result file, including filename.
+        :type fou: str | Path
+        :param size: The number of rows fetched and written for each frame, defaults to 10000.
+        :type size: int
+        :param level: The zlib compression level from 0 to 9, defaults to 6.
+        :type level: int
+        """
+        if not self._cursor or not (header := self.row_header()): return
+
+        def write_frame(frame: dict) -> None:
+            payload = zlib.compress(json.dumps(frame, default=Querier._encode).encode('utf-8'), level)
+            cou.write(len(payload).to_bytes(4, 'big'))
+            cou.write(payload)
+
+        with open(fou, 'wb') as cou:
+            cou.write(Querier.COLUMNAR_MAGIC)
+            write_frame({'columns': header})
+            for batch in self.stream(Querier.STREAM_COLUMNS, size):
+                columns = list(batch.values())
+                # the type of each column is got from its first value not empty in the batch
+                types = [
+                    type(next((var for var in column if var is not None), None)).__name__
+                    for column in columns
+                ]
+                write_frame({'types': types, 'data': columns})
+
+    @staticmethod
+    def load_columnar(fin: str | Path) -> Iterator[dict[str, list]]:
+        """
+        Read a file saved by save_columnar, without loading the whole file in memory.
+
+        :param fin: The path to the columnar file.
+        :type fin: str | Path
+        :return: An iterator of the batches of rows, each one as a dictionary with a list of values for each column.
+        :rtype: Iterator[dict[str, list]]
+        :raise IOError: If the file isn't a columnar file.
+        """
+        def read_frame() -> dict | None:
+            if not (length := cin.read(4)): return None
+            return json.loads(zlib.decompress(cin.read(int.from_bytes(length, 'big'))))
+
+        with open(fin, 'rb') as cin:
+            if cin.read(len(Querier.COLUMNAR_MAGIC)) != Querier.COLUMNAR_MAGIC:
+                raise IOError(f'Querier: no columnar file {fin} found!')
+
+            header = read_frame()['columns']
+            while frame := read_frame():
+                for col_num, column in enumerate(frame['data']):
+                    if decoder := Querier._EXPORT_DECODERS.get(frame['types'][col_num]):
+                        frame['data'][col_num] = [decoder(var) if var is not None else None for var in column]
+                yield dict(zip(header, frame['data']))
 
 
 class LowQuerier(Querier):
@@ -214,7 +613,8 @@ class LowQuerier(Querier):
     """
     def __init__(self,
                  conn_in: str | Path = ':memory:',
-                 save_changes: bool = False) -> None:
+                 save_changes: bool = False,
+                 cache_size: int = 32) -> None:
         """
         Start the connection to the SQLite database.
 
@@ -222,7 +622,11 @@ class LowQuerier(Querier):
         :type conn_in: str | Path
         :param save_changes: Enables or disables the auto-commit, defaults to True.
         :type save_changes: bool
+        :param cache_size: The maximum number of cursors kept in cache, one for each query string, defaults to 32.
+        :type cache_size: int
         """
+        self._statements: OrderedDict[str, sqlite3.Cursor] = OrderedDict()
+        self.cache_size: int = cache_size
         self._connection: sqlite3.Connection = (
             sqlite3.connect(database=conn_in, autocommit=save_changes)
             if save_changes else sqlite3.connect(database=conn_in)
@@ -231,6 +635,7 @@ class LowQuerier(Querier):
         self._connection.row_factory = sqlite3.Row
         self._cursor: sqlite3.Cursor = self._connection.cursor()
         self.rows: int = 0
+        self.batch_rows: list[int] = []
 
     def __iter__(self) -> sqlite3.Cursor:
         """
@@ -291,3 +696,151 @@ class LowQuerier(Querier):
                 return [dict(row) for row in res]
             case _:
                 return None
+
+
+class QuerierPool:
+    """
+    The QuerierPool object keeps open a set of Querier objects, to be reused by checking them out and in.
+    """
+    def __init__(self,
+                 cfg_in: str | Path = None,
+                 conn_name: str = 'main',
+                 conn_str: dict = None,
+                 save_changes: bool = False,
+                 max_size: int = 4,
+                 idle_timeout: float = 300) -> None:
+        """
+        Initialize the pool without opening any connection, that will be opened at first checkout.
+
+        :param cfg_in: The path to the JSON file with the database configurations, defaults to None.
+        :type cfg_in: str | Path
+        :param conn_name: The database configuration name in the JSON file, defaults to 'main'.
+        :type conn_name: str
+        :param conn_str: Allow to pass database configuration manually and override conn_name, defaults to None.
+        :type conn_str: dict
+        :param save_changes: Enable or disable the auto-commit, defaults to False.
+        :type save_changes: bool
+        :param max_size: The maximum number of connections opened at the same time, defaults to 4.
+        :type max_size: int
+        :param idle_timeout: The seconds after which an unused connection is closed, defaults to 300.
+        :type idle_timeout: float
+        """
+        self._kwargs: dict = {'cfg_in': cfg_in, 'conn_name': conn_name, 'conn_str': conn_str, 'save_changes': save_changes}
+        self._save_changes: bool = save_changes
+        self.max_size: int = max_size
+        self.idle_timeout: float = idle_timeout
+
+        # _idle: the connections ready to be checked out, with the time of their last checkin
+        self._idle: deque[tuple[Querier, float]] = deque()
+        self._size: int = 0
+        self._closed: bool = False
+        self._condition: threading.Condition = threading.Condition()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """
+        Get the number of connections currently opened, both idle and checked out.
+        """
+        return self._size
+
+    def _evict(self) -> list[Querier]:
+        """
+        Remove from the pool the connections unused from more than the idle timeout, must be called under lock.
+
+        :return: The list of removed Querier objects, to be closed outside the lock.
+        :rtype: list[Querier]
+        """
+        res, now = [], monotonic()
+        # the oldest connections are on the left side of the queue
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            res.append(self._idle.popleft()[0])
+            self._size -= 1
+        return res
+
+    @contextmanager
+    def checkout(self,
+                 timeout: float = None) -> Iterator[Querier]:
+        """
+        Get a working Querier object from the pool, by opening a new connection if none is idle and the pool isn't full.
+        The Querier object returns to the pool when the context ends, by reverting changes not saved.
+
+        :param timeout: The maximum seconds to wait for a connection if the pool is full, defaults to wait forever.
+        :type timeout: float
+        :return: The Querier object connected to the database.
+        :rtype: Iterator[Querier]
+        :raise TimeoutError: If no connection becomes available before the timeout.
+        :raise RuntimeError: If the pool is already closed.
+        """
+        querier = None
+        while querier is None:
+            with self._condition:
+                ready = self._condition.wait_for(lambda: self._closed or self._idle or self._size < self.max_size, timeout)
+                if not ready: raise TimeoutError(f'QuerierPool: no connection available after {timeout} seconds!')
+                if self._closed: raise RuntimeError('QuerierPool: pool already closed!')
+
+                expired = self._evict()
+                # the last returned connection is the most likely to be still alive
+                if self._idle: querier = self._idle.pop()[0]
+                else: self._size += 1
+            for var in expired: var.close()
+
+            if querier is None:
+                try:
+                    querier = Querier(**self._kwargs)
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+            elif not querier.is_alive():
+                # the broken connection is discarded and another one is got from the pool
+                querier.close()
+                with self._condition:
+                    self._size -= 1
+                querier = None
+
+        try:
+            yield querier
+        finally:
+            self._checkin(querier)
+
+    def _checkin(self,
+                 querier: Querier) -> None:
+        """
+        Return a Querier object to the pool, or close it if the pool is already closed.
+
+        :param querier: The Querier object to be returned.
+        :type querier: Querier
+        """
+        if not self._save_changes:
+            try:
+                querier.save_changes(False)
+            except Exception:
+                # the connection is broken, it will be discarded at next checkout
+                pass
+
+        with self._condition:
+            if closed := self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((querier, monotonic()))
+            expired = self._evict()
+            self._condition.notify()
+        if closed: querier.close()
+        for var in expired: var.close()
+
+    def close(self) -> None:
+        """
+        Close all the idle connections, the checked out ones will be closed when returned.
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for querier, _ in idle: querier.close()
@@ -1,5 +1,6 @@
-from .constants import PATH_CFG, PATH_LOG, PATH_PRJ
+from .constants import PATH_CFG, PATH_LOG, PATH_METRICS, PATH_PRJ
 from .feenox import Feenox
-from .recording_fees import save_documents, save_toll_groups, save_tolls
+from .recording_fees import (log_query_stats, querier_pool, save_documents, save_toll_groups, save_tolls,
+                             sync_documents)
 
 __version__ = '1.0.1'
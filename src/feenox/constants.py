@@ -1,16 +1,34 @@
+import os
 from pathlib import Path
 
 PATH_PRJ = Path(__file__).resolve().parents[2]
 PATH_CFG = PATH_PRJ / 'config'
 PATH_LOG = PATH_PRJ / 'log'
 PATH_RES = PATH_PRJ / 'res'
+# PATH_METRICS: the JSON summary of the job metrics, saved also in Prometheus text format with .prom suffix
+PATH_METRICS = PATH_PRJ / 'metrics.json'
 
-URL_LOGIN = 'https://lumesia.onelogin.com/oidc/2/token'
-URL_TOLL_GROUPS = 'https://my.lumesia.com/fai/api/api/public/ext/getTollGroups'
-URL_INVOICE_TOLLS = 'https://my.lumesia.com/fai/api/api/public/ext/searchTolls'
-URL_DAILY_TOLLS = 'https://my.lumesia.com/fai/api/api/public/ext/searchDailyTolls'
-URL_DOCUMENTS = 'https://my.lumesia.com/fai/api/api/public/ext/findDocuments'
-URL_DOWNLOAD_DOCUMENT = 'https://my.lumesia.com/fai/api/api/public/ext/downloadDocumentByUuid'
+# FEENOX_LOGIN_URL, FEENOX_API_URL: the environment variables overriding the base URLs, as to call the mock server
+URL_LOGIN = os.environ.get('FEENOX_LOGIN_URL', 'https://lumesia.onelogin.com/oidc/2/token')
+URL_API = os.environ.get('FEENOX_API_URL', 'https://my.lumesia.com/fai/api/api/public/ext').rstrip('/')
+URL_TOLL_GROUPS = f'{URL_API}/getTollGroups'
+URL_INVOICE_TOLLS = f'{URL_API}/searchTolls'
+URL_DAILY_TOLLS = f'{URL_API}/searchDailyTolls'
+URL_DOCUMENTS = f'{URL_API}/findDocuments'
+URL_DOWNLOAD_DOCUMENT = f'{URL_API}/downloadDocumentByUuid'
+
+# HTTP_TIMEOUT: the connect and read timeouts in seconds for each API call
+HTTP_TIMEOUT = (10, 120)
+HTTP_POOL_SIZE = 10
+HTTP_RETRIES = 5
+# HTTP_BACKOFF: the backoff factor in seconds for retries, waiting backoff * 2^retry plus a random jitter up to backoff
+HTTP_BACKOFF = 0.5
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RESUMES = 3
+# STREAM_CHUNK_SIZE: the number of bytes read for each chunk of the streamed JSON responses
+STREAM_CHUNK_SIZE = 64 * 1024
 
 QUERY_GET_TOLL_GROUPS = """\
     SELECT code
@@ -29,13 +47,71 @@ QUERY_GET_LAST_TOLL_DATE = """\
     WHERE toll_genre = ?
     ;
 """
+QUERY_GET_LAST_TOLL_ACQUISITION_DATE = """\
+    SELECT MAX(acquisition_date) AS max_date
+    FROM feenox.toll
+    WHERE toll_genre = ?
+    ;
+"""
+QUERY_COUNT_TOLL_DUPLICATES_AVOIDED = """\
+    SELECT COUNT(*) AS nr_tolls
+    FROM feenox.toll
+    WHERE toll_genre = ?
+        AND exit_date >= ?
+        AND acquisition_date < ?
+    ;
+"""
+
+QUERY_GET_TOLL_CHECKPOINT = """\
+    SELECT date_to
+    FROM feenox.toll_checkpoint
+    WHERE toll_genre = ?
+        AND date_type = ?
+    ;
+"""
+QUERY_UPSERT_TOLL_CHECKPOINT = """\
+    INSERT INTO feenox.toll_checkpoint (
+        toll_genre,
+        date_type,
+        date_from,
+        date_to,
+        nr_tolls,
+        nr_duplicates,
+        recording_date
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (toll_genre, date_type) DO UPDATE
+    SET date_from = EXCLUDED.date_from,
+        date_to = EXCLUDED.date_to,
+        nr_tolls = EXCLUDED.nr_tolls,
+        nr_duplicates = EXCLUDED.nr_duplicates,
+        recording_date = EXCLUDED.recording_date
+    ;
+"""
 
-QUERY_CHECK_DUPLICATE = """\
-    SELECT COUNT(DISTINCT id) AS nr_id,
-        COUNT(DISTINCT global_identifier) AS nr_global_identifier
+# the {values} placeholder must be replaced with a (?, ?) row for each toll to be checked
+QUERY_CHECK_DUPLICATES = """\
+    SELECT candidate.id,
+        candidate.global_identifier,
+        COUNT(DISTINCT toll_id.id) AS nr_id,
+        COUNT(DISTINCT toll_global_identifier.global_identifier) AS nr_global_identifier
+    FROM (VALUES {values}) AS candidate (id, global_identifier)
+        LEFT JOIN feenox.toll AS toll_id
+            ON toll_id.id = candidate.id
+        LEFT JOIN feenox.toll AS toll_global_identifier
+            ON toll_global_identifier.global_identifier = candidate.global_identifier
+    GROUP BY candidate.id, candidate.global_identifier
+    ;
+"""
+
+QUERY_GET_TOLL_INDEX = """\
+    SELECT id,
+        global_identifier,
+        {date_column} AS toll_date,
+        recording_date
     FROM feenox.toll
-    WHERE id = ?
-        OR global_identifier = ?
+    WHERE toll_genre = ?
+        AND {date_column} >= ?
+        AND recording_date >= ?
     ;
 """
 
@@ -79,11 +155,57 @@ QUERY_INSERT_TOLL = """\
     ;
 """
 
-QUERY_GET_DOCUMENTS = """\
-    SELECT id 
+# the {values} placeholder must be replaced with a ? for each document id to be checked
+QUERY_CHECK_DOCUMENTS = """\
+    SELECT id
     FROM feenox.document
+    WHERE id IN ({values})
+    ;
+"""
+
+QUERY_GET_DOCUMENT_CHECKPOINT = """\
+    SELECT publication_date
+    FROM feenox.document_checkpoint
+    WHERE document_type = ?
+    ;
+"""
+QUERY_UPSERT_DOCUMENT_CHECKPOINT = """\
+    INSERT INTO feenox.document_checkpoint (
+        document_type,
+        publication_date,
+        recording_date
+    ) VALUES (?, ?, ?)
+    ON CONFLICT (document_type) DO UPDATE
+    SET publication_date = EXCLUDED.publication_date,
+        recording_date = EXCLUDED.recording_date
+    ;
+"""
+
+QUERY_GET_DOCUMENT_FAILURES = """\
+    SELECT id,
+        nr_failures
+    FROM feenox.document_failure
+    WHERE id IN ({values})
     ;
 """
+QUERY_UPSERT_DOCUMENT_FAILURE = """\
+    INSERT INTO feenox.document_failure AS failure (
+        id,
+        document_type,
+        customer_code,
+        document_date,
+        publication_date,
+        nr_failures,
+        last_error,
+        recording_date
+    ) VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+    ON CONFLICT (id) DO UPDATE
+    SET nr_failures = failure.nr_failures + 1,
+        last_error = EXCLUDED.last_error,
+        recording_date = EXCLUDED.recording_date
+    ;
+"""
+
 QUERY_INSERT_DOCUMENT = """\
     INSERT INTO feenox.document (
         id,
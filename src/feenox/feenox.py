@@ -1,13 +1,20 @@
+import codecs
 import json
+from collections.abc import Iterable, Iterator
 from datetime import date, datetime, timedelta
+from decimal import Decimal
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import requests
+from core import decode_json, metrics
+from .constants import (DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RESUMES, HTTP_BACKOFF, HTTP_POOL_SIZE, HTTP_RETRIES,
+                        HTTP_RETRY_STATUS, HTTP_TIMEOUT, PATH_PRJ, STREAM_CHUNK_SIZE, URL_DAILY_TOLLS,
+                        URL_DOCUMENTS, URL_DOWNLOAD_DOCUMENT, URL_INVOICE_TOLLS, URL_LOGIN, URL_TOLL_GROUPS)
+from .token_manager import TokenManager
 
-from core import decode_json
-from .constants import (PATH_PRJ, URL_DAILY_TOLLS, URL_DOCUMENTS, URL_DOWNLOAD_DOCUMENT,
-                        URL_INVOICE_TOLLS, URL_LOGIN, URL_TOLL_GROUPS)
+# requests is imported only when the first API call is made, to keep fast the import of the package
+if TYPE_CHECKING:
+    import requests
 
 
 class Feenox:
@@ -16,6 +23,11 @@ class Feenox:
     """
     # _cache: save in cache the token to be reuse quickly during same run without make authentication call
     _cache: dict[str, Any] = {}
+    # _tokens: the token manager shared by all API calls, refreshing the token once for all threads and processes
+    _tokens: TokenManager = None
+    # _session: the shared HTTP session, keeping alive the pooled connections between API calls
+    _session: 'requests.Session' = None
+    _timeout: tuple[float, float] = HTTP_TIMEOUT
 
     _PATH_CFG: Path = None
 
@@ -23,57 +35,133 @@ class Feenox:
                  cfg_in: str | Path,
                  force: bool = False):
         """
-        Read from a JSON file the credentials and retrive the token for other API calls.
-        The token will be saved on a cache file in the project root for reuse it if still valid.
+        Set the JSON file with the credentials used to retrieve the token for other API calls.
+        The token is retrieved at the first API call, unless forced, so that creating the object doesn't make any call.
+        The token will be saved on a cache file in the project root for reuse it if still valid,
+        and it will be refreshed in background before expiring.
 
         :param cfg_in: The path to the JSON file with the login credentials.
         :type cfg_in: str | Path
         :param force: Force the regeneration of the token, even if the previous one is still valid, defaults to False.
         :type force: bool
         """
-        if not Feenox._cache or force:
-            cache = PATH_PRJ / '.cache'
+        cfg_in = Path(cfg_in).resolve()
+        # if input path is a directory search for default config filename
+        if cfg_in.is_dir():
+            cfg_in = cfg_in / 'feenox.json'
+        Feenox._PATH_CFG = cfg_in
 
-            # check if the cache file exists and his token is still valid
-            if cache.is_file() and not force:
-                Feenox._cache = decode_json(cache)
-                Feenox._cache['expire'] = datetime.fromisoformat(Feenox._cache['expire'])
-                Feenox._check_token_expire(cfg_in)
-            else:
-                cfg_in = Path(cfg_in).resolve()
-                # if input path is a directory search for default config filename
-                if cfg_in.is_dir():
-                    cfg_in = cfg_in / 'feenox.json'
-                Feenox._PATH_CFG = cfg_in
-                config = decode_json(cfg_in)
-
-                (response := requests.post(
-                    url=URL_LOGIN,
-                    data={'grant_type': 'client_credentials'},
-                    auth=(config['client_id'], config['client_secret'])
-                )).raise_for_status()
-
-                response = response.json()
-                Feenox._cache['token'] = f"{response['token_type']} {response['access_token']}"
-                Feenox._cache['expire'] = datetime.now() + timedelta(seconds=response['expires_in'])
-
-                with open(cache, 'w', encoding='utf-8') as jou:
-                    json.dump(Feenox._cache, jou,
-                              default=(lambda obj: obj.isoformat()
-                                       if isinstance(obj, datetime)
-                                       else TypeError(f'Type {type(obj)} not serializable')))
+        if not Feenox._tokens:
+            Feenox._tokens = TokenManager(Feenox._login, PATH_PRJ / '.cache')
+        if force: Feenox._cache = Feenox._tokens.get(force=True)
 
     @classmethod
-    def _check_token_expire(cls,
-                            cfg_in: str | Path = None) -> None:
+    def _login(cls) -> dict[str, Any]:
         """
-        Check if the current token has already expired or is still valid.
+        Make the login call with the credentials read from the JSON file.
 
-        :param cfg_in: The path to the JSON file with the login credentials, defaults to None.
-        :type cfg_in: str | Path
+        :return: A dictionary with the token and its expire datetime.
+        :rtype: dict[str, Any]
+        """
+        config = decode_json(cls._PATH_CFG)
+        response = cls._request(
+            'POST',
+            url=URL_LOGIN,
+            data={'grant_type': 'client_credentials'},
+            auth=(config['client_id'], config['client_secret'])
+        ).json()
+        return {
+            'token': f"{response['token_type']} {response['access_token']}",
+            'expire': datetime.now() + timedelta(seconds=response['expires_in'])
+        }
+
+    @classmethod
+    def configure_session(cls,
+                          pool_size: int = HTTP_POOL_SIZE,
+                          timeout: float | tuple[float, float] = HTTP_TIMEOUT,
+                          retries: int = HTTP_RETRIES,
+                          backoff: float = HTTP_BACKOFF) -> 'requests.Session':
+        """
+        Create the shared HTTP session used by all API calls, replacing the previous one if already created.
+        The failed calls with status 429 or 5xx will be retried with exponential backoff and random jitter,
+        by waiting the Retry-After header value if sent by the server.
+
+        :param pool_size: The maximum number of connections kept alive for each host, defaults to HTTP_POOL_SIZE.
+        :type pool_size: int
+        :param timeout: The connect and read timeouts in seconds, or a single value for both, defaults to HTTP_TIMEOUT.
+        :type timeout: float | tuple[float, float]
+        :param retries: The maximum number of retries for each API call, defaults to HTTP_RETRIES.
+        :type retries: int
+        :param backoff: The backoff factor in seconds between retries, defaults to HTTP_BACKOFF.
+        :type backoff: float
+        :return: The new HTTP session.
+        :rtype: Session
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        if cls._session: cls._session.close()
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                backoff_jitter=backoff,
+                status_forcelist=HTTP_RETRY_STATUS,
+                # all API calls are read-only, so retry also POST calls
+                allowed_methods=None,
+                respect_retry_after_header=True,
+                # return the last response after all retries, for raising the HTTP error on it
+                raise_on_status=False
+            )
+        )
+        cls._session = requests.Session()
+        cls._session.mount('https://', adapter)
+        cls._session.mount('http://', adapter)
+        cls._timeout = timeout
+        return cls._session
+
+    @classmethod
+    def _request(cls,
+                 method: str,
+                 url: str,
+                 endpoint: str = None,
+                 **kwargs) -> 'requests.Response':
+        """
+        Make an API call through the shared HTTP session and check the response status.
+        The latency of the call is measured by endpoint, until the response headers are received.
+
+        :param method: The HTTP method of the call.
+        :type method: str
+        :param url: The URL of the call.
+        :type url: str
+        :param endpoint: The endpoint name used in metrics, defaults to the last part of the URL.
+        :type endpoint: str
+        :param kwargs: The further arguments passed to the session request.
+        :type kwargs: Any
+        :return: The API call response.
+        :rtype: Response
+        :raise HTTPError: If the response status is an error, after all retries.
+        """
+        if not cls._session: cls.configure_session()
+        endpoint = endpoint or url.rstrip('/').rsplit('/', 1)[-1]
+        with metrics.timer('api_request', endpoint=endpoint):
+            response = cls._session.request(method, url, timeout=cls._timeout, **kwargs)
+        metrics.count('api_response', endpoint=endpoint, status=response.status_code)
+        response.raise_for_status()
+        return response
+
+    @classmethod
+    def _check_token_expire(cls) -> None:
+        """
+        Check if the current token has already expired or is still valid, by refreshing it if expired.
+        The background refresh of the token is started at the first check.
         """
-        if not cls._cache['expire'] - datetime.now() > timedelta(seconds=60):
-            cls(cfg_in, force=True) if cfg_in else cls(cls._PATH_CFG, force=True)
+        cls._cache = cls._tokens.get()
+        cls._tokens.start()
 
     @classmethod
     def get_toll_groups(cls) -> list[dict[str, str]]:
@@ -84,10 +172,11 @@ class Feenox:
         :rtype: list[dict[str, str]]
         """
         cls._check_token_expire()
-        (response := requests.get(
+        response = cls._request(
+            'GET',
             url=URL_TOLL_GROUPS,
             headers={'x-token': cls._cache['token']}
-        )).raise_for_status()
+        )
         return response.json()
 
     @staticmethod
@@ -123,15 +212,18 @@ class Feenox:
         return date_type, date_from, date_to
 
     @classmethod
-    def get_invoice_tolls(cls,
-                          toll_groups: list[str] = None,
-                          tolls_date: tuple[date, date] = None,
-                          acquisition_date: tuple[date, date] = None,
-                          invoice_date: tuple[date, date] = None) -> list[dict[str, Any]]:
+    def _search_tolls(cls,
+                      url: str,
+                      toll_groups: list[str] = None,
+                      tolls_date: tuple[date, date] = None,
+                      acquisition_date: tuple[date, date] = None,
+                      invoice_date: tuple[date, date] = None,
+                      stream: bool = False) -> 'requests.Response':
         """
-        Retrieve the list of all invoice tolling detail filtering by tolling groups and dates.
-        At least one date parameter is mandatory, with maximum 7 days interval between them and not older than 90 days.
+        Make a tolls search call filtering by tolling groups and dates.
 
+        :param url: The URL of the tolls search call.
+        :type url: str
         :param toll_groups: The list of tolling groups to retrieve, defaults to None.
         :type toll_groups: list[str]
         :param tolls_date: Filter on tolling exit gate date, defaults to None.
@@ -140,14 +232,17 @@ class Feenox:
         :type acquisition_date: tuple[date, date]
         :param invoice_date: Filter on invoice date, defaults to None.
         :type invoice_date: tuple[date, date]
-        :return: A list of dictionary with the tolling details.
-        :rtype: dict[str, Any]
+        :param stream: Enable or disable the deferred download of the response body, defaults to False.
+        :type stream: bool
+        :return: The API call response.
+        :rtype: Response
         """
         cls._check_token_expire()
         date_type, date_from, date_to = cls._check_tolls_date(tolls_date, acquisition_date, invoice_date)
 
-        (response := requests.post(
-            url=URL_INVOICE_TOLLS,
+        return cls._request(
+            'POST',
+            url=url,
             headers={'x-token': cls._cache['token']},
             json={
                 'tollsGroup': (toll_groups if toll_groups else []),
@@ -155,9 +250,107 @@ class Feenox:
                     'date_from': date_from.isoformat(),
                     'date_to': date_to.isoformat()
                 }
-            }
-        )).raise_for_status()
-        return response.json()
+            },
+            stream=stream
+        )
+
+    @staticmethod
+    def _iter_json(chunks: Iterable[bytes],
+                   batch_size: int = None) -> Iterator[Any | list[Any]]:
+        """
+        Decode a JSON array by chunks, yielding its items as soon as they are complete.
+        The floating numbers are decoded as decimal objects.
+
+        :param chunks: The iterable of the JSON array bytes, split in chunks.
+        :type chunks: Iterable[bytes]
+        :param batch_size: The number of items yielded together as a list, defaults to one item at a time.
+        :type batch_size: int
+        :return: An iterator of the array items, or of lists of array items if batch_size is specified.
+        :rtype: Iterator[Any | list[Any]]
+        :raise JSONDecodeError: If the JSON is not valid or is not an array.
+        """
+        # decode floating numbers directly as decimal objects, to avoid the conversion later
+        decoder, reader = json.JSONDecoder(parse_float=Decimal), codecs.getincrementaldecoder('utf-8')()
+        chunks, buffer, pos, eof = iter(chunks), '', 0, False
+        # expected: the next delimiter, or ']' after the array start for an item or the end, or None for an item only
+        expected, batch = '[', []
+
+        def read() -> None:
+            # the buffer keeps only the text not yet decoded, with the next chunk appended
+            nonlocal buffer, pos, eof
+            chunk = next(chunks, None)
+            buffer, pos, eof = buffer[pos:] + reader.decode(chunk or b'', final=chunk is None), 0, chunk is None
+
+        while True:
+            # skip blanks between tokens, by reading the next chunk if buffer ends
+            while pos == len(buffer) or buffer[pos].isspace():
+                if pos < len(buffer):
+                    pos += 1
+                elif eof:
+                    raise json.JSONDecodeError('Unexpected end of JSON array', buffer, pos)
+                else:
+                    read()
+
+            if buffer[pos] == ']' and expected in (',', ']'):
+                pos += 1
+                break
+            elif expected in ('[', ','):
+                if buffer[pos] != expected:
+                    raise json.JSONDecodeError(f'Expecting {expected!r} delimiter', buffer, pos)
+                pos, expected = pos + 1, ']' if expected == '[' else None
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # an item ending near the buffer end could be truncated, as a number before its fraction or exponent
+                if not eof and len(buffer) - end < 3:
+                    raise json.JSONDecodeError('Truncated item', buffer, pos)
+            except json.JSONDecodeError:
+                if eof: raise
+                read()
+                continue
+
+            pos, expected = end, ','
+            if not batch_size:
+                yield item
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        # only blanks can follow the array end
+        while pos < len(buffer) or not eof:
+            if pos == len(buffer):
+                read()
+            elif buffer[pos].isspace():
+                pos += 1
+            else:
+                raise json.JSONDecodeError('Extra data', buffer, pos)
+        if batch: yield batch
+
+    @classmethod
+    def get_invoice_tolls(cls,
+                          toll_groups: list[str] = None,
+                          tolls_date: tuple[date, date] = None,
+                          acquisition_date: tuple[date, date] = None,
+                          invoice_date: tuple[date, date] = None) -> list[dict[str, Any]]:
+        """
+        Retrieve the list of all invoice tolling detail filtering by tolling groups and dates.
+        At least one date parameter is mandatory, with maximum 7 days interval between them and not older than 90 days.
+
+        :param toll_groups: The list of tolling groups to retrieve, defaults to None.
+        :type toll_groups: list[str]
+        :param tolls_date: Filter on tolling exit gate date, defaults to None.
+        :type tolls_date: tuple[date, date]
+        :param acquisition_date: Filter on data acquisition date, defaults to None.
+        :type acquisition_date: tuple[date, date]
+        :param invoice_date: Filter on invoice date, defaults to None.
+        :type invoice_date: tuple[date, date]
+        :return: A list of dictionary with the tolling details.
+        :rtype: dict[str, Any]
+        """
+        return cls._search_tolls(URL_INVOICE_TOLLS, toll_groups, tolls_date, acquisition_date, invoice_date).json()
 
     @classmethod
     def get_daily_tolls(cls,
@@ -180,21 +373,63 @@ class Feenox:
         :return: A list of dictionary with the tolling details.
         :rtype: dict[str, Any]
         """
-        cls._check_token_expire()
-        date_type, date_from, date_to = cls._check_tolls_date(tolls_date, acquisition_date, invoice_date)
+        return cls._search_tolls(URL_DAILY_TOLLS, toll_groups, tolls_date, acquisition_date, invoice_date).json()
 
-        (response := requests.post(
-            url=URL_DAILY_TOLLS,
-            headers={'x-token': cls._cache['token']},
-            json={
-                'tollsGroup': (toll_groups if toll_groups else []),
-                date_type: {
-                    'date_from': date_from.isoformat(),
-                    'date_to': date_to.isoformat()
-                }
-            }
-        )).raise_for_status()
-        return response.json()
+    @classmethod
+    def iter_invoice_tolls(cls,
+                           toll_groups: list[str] = None,
+                           tolls_date: tuple[date, date] = None,
+                           acquisition_date: tuple[date, date] = None,
+                           invoice_date: tuple[date, date] = None,
+                           batch_size: int = None) -> Iterator[dict[str, Any] | list[dict[str, Any]]]:
+        """
+        Retrieve all invoice tolling detail filtering by tolling groups and dates, by streaming the response.
+        At least one date parameter is mandatory, with maximum 7 days interval between them and not older than 90 days.
+
+        :param toll_groups: The list of tolling groups to retrieve, defaults to None.
+        :type toll_groups: list[str]
+        :param tolls_date: Filter on tolling exit gate date, defaults to None.
+        :type tolls_date: tuple[date, date]
+        :param acquisition_date: Filter on data acquisition date, defaults to None.
+        :type acquisition_date: tuple[date, date]
+        :param invoice_date: Filter on invoice date, defaults to None.
+        :type invoice_date: tuple[date, date]
+        :param batch_size: The number of tolling details yielded together as a list, defaults to one at a time.
+        :type batch_size: int
+        :return: An iterator of dictionary with the tolling details, or of lists of them if batch_size is specified.
+        :rtype: Iterator[dict[str, Any] | list[dict[str, Any]]]
+        """
+        with cls._search_tolls(URL_INVOICE_TOLLS, toll_groups, tolls_date, acquisition_date, invoice_date,
+                               stream=True) as response:
+            yield from cls._iter_json(response.iter_content(STREAM_CHUNK_SIZE), batch_size)
+
+    @classmethod
+    def iter_daily_tolls(cls,
+                         toll_groups: list[str] = None,
+                         tolls_date: tuple[date, date] = None,
+                         acquisition_date: tuple[date, date] = None,
+                         invoice_date: tuple[date, date] = None,
+                         batch_size: int = None) -> Iterator[dict[str, Any] | list[dict[str, Any]]]:
+        """
+        Retrieve all daily tolling detail filtering by tolling groups and dates, by streaming the response.
+        At least one date parameter is mandatory, with maximum 7 days interval between them and not older than 90 days.
+
+        :param toll_groups: The list of tolling groups to retrieve, defaults to None.
+        :type toll_groups: list[str]
+        :param tolls_date: Filter on tolling exit gate date, defaults to None.
+        :type tolls_date: tuple[date, date]
+        :param acquisition_date: Filter on data acquisition date, defaults to None.
+        :type acquisition_date: tuple[date, date]
+        :param invoice_date: Filter on invoice date, defaults to None.
+        :type invoice_date: tuple[date, date]
+        :param batch_size: The number of tolling details yielded together as a list, defaults to one at a time.
+        :type batch_size: int
+        :return: An iterator of dictionary with the tolling details, or of lists of them if batch_size is specified.
+        :rtype: Iterator[dict[str, Any] | list[dict[str, Any]]]
+        """
+        with cls._search_tolls(URL_DAILY_TOLLS, toll_groups, tolls_date, acquisition_date, invoice_date,
+                               stream=True) as response:
+            yield from cls._iter_json(response.iter_content(STREAM_CHUNK_SIZE), batch_size)
 
     @staticmethod
     def _check_documents_date(document_date: tuple[date, date] = None,
@@ -244,41 +479,105 @@ class Feenox:
         if res := cls._check_documents_date(document_date, publication_date):
             date_type, date_from, date_to = res
 
-        (response := requests.post(
+        response = cls._request(
+            'POST',
             url=f"{URL_DOCUMENTS}/{document_type}{(f'/{document_category}' if document_category else '')}",
             headers={'x-token': cls._cache['token']},
             json=({
                 date_type: {
-                    'date_from': date_from,
-                    'date_to': date_to
+                    'date_from': date_from.isoformat(),
+                    'date_to': date_to.isoformat()
                 }
             } if res else {})
-        )).raise_for_status()
+        )
         return response.json()
 
     @classmethod
     def download_document(cls,
                           document_id: str,
-                          directory: str | Path) -> Path:
+                          directory: str | Path,
+                          stream: bool = True,
+                          chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                          resumes: int = DOWNLOAD_RESUMES) -> Path:
         """
         Download a specific document specified by id.
+        In streaming mode the file is written by chunks on a temporary file in the same folder, renamed when completed.
+        An interrupted download is resumed from the temporary file size, if the server allows range requests.
 
         :param document_id: The document id retrieve from search documents call.
         :type document_id: str
         :param directory: The path to the folder where to save the downloaded file.
         :type directory: str | Path
+        :param stream: Enable or disable the streaming download instead of buffering the file in memory, defaults to True.
+        :type stream: bool
+        :param chunk_size: The number of bytes read and written for each chunk in streaming mode, defaults to DOWNLOAD_CHUNK_SIZE.
+        :type chunk_size: int
+        :param resumes: The maximum number of download resumes after an interruption, defaults to DOWNLOAD_RESUMES.
+        :type resumes: int
         :return: The path to the downloaded file.
         :rtype: Path
+        :raise IOError: If the downloaded file size doesn't match the Content-Length header after all resumes.
         """
-        cls._check_token_expire()
-        (response := requests.get(
-            url=f'{URL_DOWNLOAD_DOCUMENT}/{document_id}',
-            headers={'x-token': cls._cache['token']}
-        )).raise_for_status()
-
         directory = Path(directory).resolve()
         # input path must a directory, the filename will be got from response header
-        fou = (directory if directory.is_dir() else directory.parent) / response.headers['x-filename']
-        with open(fou, 'wb') as res:
-            res.write(response.content)
-        return fou
+        directory = directory if directory.is_dir() else directory.parent
+
+        if not stream:
+            cls._check_token_expire()
+            response = cls._request(
+                'GET',
+                url=f'{URL_DOWNLOAD_DOCUMENT}/{document_id}',
+                endpoint='downloadDocumentByUuid',
+                headers={'x-token': cls._cache['token']}
+            )
+
+            fou = directory / response.headers['x-filename']
+            with open(fou, 'wb') as res:
+                res.write(response.content)
+            metrics.count('download_bytes', len(response.content))
+            return fou
+
+        import requests
+
+        # the temporary file is named by document id, so that an interrupted download can be resumed in a later run
+        part = directory / f'.{document_id}.part'
+        for resume in range(resumes + 1):
+            cls._check_token_expire()
+            offset = part.stat().st_size if part.is_file() else 0
+            headers = {'x-token': cls._cache['token']}
+            if offset: headers['Range'] = f'bytes={offset}-'
+
+            try:
+                with cls._request(
+                    'GET',
+                    url=f'{URL_DOWNLOAD_DOCUMENT}/{document_id}',
+                    endpoint='downloadDocumentByUuid',
+                    headers=headers,
+                    stream=True
+                ) as response:
+                    # if the server ignores the range request the whole file will be sent again
+                    if response.status_code != 206: offset = 0
+                    size = (
+                        offset + int(response.headers['Content-Length'])
+                        if 'Content-Length' in response.headers and 'Content-Encoding' not in response.headers
+                        else None
+                    )
+                    with open(part, 'ab' if offset else 'wb') as res:
+                        for chunk in response.iter_content(chunk_size):
+                            res.write(chunk)
+                            metrics.count('download_bytes', len(chunk))
+                    filename = response.headers['x-filename']
+            except requests.HTTPError as exc:
+                # the temporary file is not valid for the range request, so restart the download from scratch
+                if exc.response.status_code != 416 or not offset: raise
+                part.unlink(missing_ok=True)
+                continue
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                if resume == resumes: raise
+                continue
+
+            if size is None or part.stat().st_size == size:
+                fou = directory / filename
+                part.replace(fou)
+                return fou
+        raise IOError(f'Feenox: download of document {document_id} not completed after {resumes} resumes!')
@@ -0,0 +1,526 @@
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import urlsplit
+
+from core import get_logger
+from .constants import PATH_LOG
+
+logger = get_logger(PATH_LOG, __name__)
+
+
+@dataclass(slots=True)
+class MockConfig:
+    """
+    The MockConfig object collects the size of the synthetic data and the faults injected by the mock server.
+    """
+    seed: int = 0
+    toll_groups: int = 5
+    tolls_per_day: int = 1000
+    documents_per_day: int = 5
+    document_size: int = 64 * 1024
+    token_ttl: int = 3600
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate_limit: float = 0.0
+    error_rate: float = 0.0
+    chunk_size: int = 500
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    The MockServer object is a local stand-in of the FAI SERVICE API, serving synthetic tolls and documents.
+    The same request always gets the same data, so the saved tolls and documents are found again by next runs.
+    Each request can be delayed, throttled by a rate limit or failed with a server error, as configured.
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 address: tuple[str, int],
+                 config: MockConfig = None) -> None:
+        """
+        Initialize the server listening on the address, without serving requests until serve_forever is called.
+
+        :param address: The host and port of the server, port 0 to choose a free port.
+        :type address: tuple[str, int]
+        :param config: The size of the synthetic data and the faults injected, defaults to the MockConfig ones.
+        :type config: MockConfig
+        """
+        super().__init__(address, _MockHandler)
+        self.config: MockConfig = config or MockConfig()
+        self._tokens: dict[str, datetime] = {}
+        # documents: the filename of the documents already listed, to be downloaded by id
+        self._documents: dict[str, str] = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._allowance: float = self.config.rate_limit
+        self._last: float = time.monotonic()
+
+    @property
+    def url(self) -> str:
+        """
+        Get the base URL of the server, to be set as FEENOX_API_URL environment variable.
+        """
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _random(self,
+                *keys: Any) -> random.Random:
+        """
+        Get a random generator seeded by the server seed and the keys, to generate always the same data.
+
+        :param keys: The keys identifying the generated data.
+        :type keys: Any
+        :return: The seeded random generator.
+        :rtype: Random
+        """
+        return random.Random(':'.join(str(key) for key in (self.config.seed, *keys)))
+
+    def throttle(self) -> bool:
+        """
+        Check if a request is allowed by the rate limit, with a token bucket refilled every second.
+
+        :return: True if the request is allowed, False if it must be rejected.
+        :rtype: bool
+        """
+        if not (rate := self.config.rate_limit): return True
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(rate, self._allowance + (now - self._last) * rate)
+            self._last = now
+            if self._allowance < 1: return False
+            self._allowance -= 1
+        return True
+
+    def login(self) -> dict[str, Any]:
+        """
+        Create a new token, valid for the token TTL seconds.
+
+        :return: A dictionary with the token as the login response.
+        :rtype: dict[str, Any]
+        """
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens[token] = datetime.now() + timedelta(seconds=self.config.token_ttl)
+        return {'access_token': token, 'token_type': 'Bearer', 'expires_in': self.config.token_ttl}
+
+    def check_token(self,
+                    header: str | None) -> bool:
+        """
+        Check if the token sent in the x-token header is known and not expired.
+
+        :param header: The x-token header value, as token type and token.
+        :type header: str | None
+        :return: True if the token is valid, False otherwise.
+        :rtype: bool
+        """
+        if not header: return False
+        expire = self._tokens.get(header.rsplit(' ', 1)[-1])
+        return expire is not None and expire > datetime.now()
+
+    def get_toll_groups(self) -> list[dict[str, str]]:
+        """
+        Get the tolling groups, named by their number.
+
+        :return: A list of dictionary with the tolling groups, as the toll groups response.
+        :rtype: list[dict[str, str]]
+        """
+        return [
+            {'tollsGroup': f'G{code:02d}', 'tollsGroupDescription': f'toll group {code}'}
+            for code in range(1, self.config.toll_groups + 1)
+        ]
+
+    def _get_tolls(self,
+                   toll_genre: str,
+                   acquisition_date: date) -> list[dict[str, Any]]:
+        """
+        Generate the tolls acquired in a day, with the exit some days before and the invoice some days after it.
+
+        :param toll_genre: The genre of the tolls, D for invoice or P for daily tolls.
+        :type toll_genre: str
+        :param acquisition_date: The day of the tolls acquisition.
+        :type acquisition_date: date
+        :return: A list of dictionary with the tolling details.
+        :rtype: list[dict[str, Any]]
+        """
+        rnd, is_invoice = self._random('tolls', toll_genre, acquisition_date), toll_genre == 'D'
+        day = datetime.combine(acquisition_date, datetime.min.time())
+        tolls = []
+        for _ in range(self.config.tolls_per_day):
+            acquisition = day + timedelta(seconds=rnd.randrange(86400))
+            exit_timestamp = acquisition - timedelta(seconds=rnd.randrange(2 * 86400))
+            entry_timestamp = exit_timestamp - timedelta(seconds=rnd.randint(600, 10800))
+            toll_group = f'G{rnd.randint(1, self.config.toll_groups):02d}'
+            amount = round(rnd.uniform(1, 100), 2)
+            tolls.append({
+                'id': str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+                'nation': 'IT',
+                'toll_group_code': toll_group,
+                'type': toll_genre,
+                'filename': f'{toll_genre}_{acquisition_date:%Y%m%d}_{toll_group}.txt',
+                'acquisition_date': acquisition.isoformat(),
+                'customer_code': f'C{rnd.randint(1, 10):03d}',
+                'contract_code': f'K{rnd.randint(1, 20):03d}',
+                'sign_of_transaction': '+' if rnd.random() > 0.01 else '-',
+                'amount_no_vat': amount,
+                'amount_including_vat': round(amount * 1.22, 2),
+                'vat': 22,
+                'currency_code': 'EUR',
+                'exchange_rate': None,
+                'network_code': f'N{rnd.randint(1, 9)}',
+                'entry_global_gate_identifier': f'GT{rnd.randint(1, 500):04d}',
+                'entry_global_gate_identifier_description': 'entry gate',
+                'entry_timestamp': entry_timestamp.isoformat(),
+                'exit_global_gate_identifier': f'GT{rnd.randint(1, 500):04d}',
+                'exit_global_gate_identifier_description': 'exit gate',
+                'exit_timestamp': exit_timestamp.isoformat(),
+                'km': round(rnd.uniform(1, 300), 1),
+                'device_type': 'OBU',
+                'obu': f'{rnd.randrange(10 ** 12):012d}',
+                'pan_number': None,
+                'vehicle_plate': f'AB{rnd.randint(0, 999):03d}CD',
+                'vehicle_country': 'IT',
+                'vehicle_euro_class': 'EURO6',
+                'vehicle_tariff_class': 'A',
+                'invoice_article': 'PEDAGGI' if is_invoice else None,
+                'invoice_nr': f'INV{acquisition_date:%Y%m}' if is_invoice else None,
+                'invoice_date': (acquisition + timedelta(days=rnd.randint(0, 3))).isoformat() if is_invoice else None
+            })
+        return tolls
+
+    def search_tolls(self,
+                     toll_genre: str,
+                     toll_groups: list[str],
+                     date_type: str,
+                     date_from: date,
+                     date_to: date) -> Iterator[dict[str, Any]]:
+        """
+        Search the tolls filtering by tolling groups and by one of their dates.
+
+        :param toll_genre: The genre of the tolls, D for invoice or P for daily tolls.
+        :type toll_genre: str
+        :param toll_groups: The list of tolling groups to retrieve, all if empty.
+        :type toll_groups: list[str]
+        :param date_type: The date filtered, as tolls for exit, acquisition or invoice.
+        :type date_type: str
+        :param date_from: The first day of the filter.
+        :type date_from: date
+        :param date_to: The last day of the filter.
+        :type date_to: date
+        :return: An iterator of dictionary with the tolling details.
+        :rtype: Iterator[dict[str, Any]]
+        """
+        # the tolls are generated by acquisition day, so search also the days acquiring the tolls exited or invoiced
+        field, begin, end = {
+            'tolls': ('exit_timestamp', date_from, date_to + timedelta(days=2)),
+            'acquisition': ('acquisition_date', date_from, date_to),
+            'invoice': ('invoice_date', date_from - timedelta(days=3), date_to)
+        }[date_type]
+        for day in range((end - begin).days + 1):
+            for toll in self._get_tolls(toll_genre, begin + timedelta(days=day)):
+                if toll_groups and toll['toll_group_code'] not in toll_groups: continue
+                if toll[field] and date_from <= date.fromisoformat(toll[field][:10]) <= date_to: yield toll
+
+    def search_documents(self,
+                         document_type: str,
+                         document_category: str | None,
+                         date_type: str | None,
+                         date_from: date = None,
+                         date_to: date = None) -> list[dict[str, Any]]:
+        """
+        Search the documents published in the last 90 days, filtering by type, category and one of their dates.
+
+        :param document_type: The document type to be searched.
+        :type document_type: str
+        :param document_category: The document category to be searched, or None for all.
+        :type document_category: str | None
+        :param date_type: The date filtered, as documentDate or documentPublicationDate, or None for all.
+        :type date_type: str | None
+        :param date_from: The first day of the filter, defaults to None.
+        :type date_from: date
+        :param date_to: The last day of the filter, defaults to None.
+        :type date_to: date
+        :return: A list of dictionary with the documents details.
+        :rtype: list[dict[str, Any]]
+        """
+        extension = ext.lower() if (ext := document_type.rsplit('_', 1)[-1]) in ('CSV', 'TXT') else 'pdf'
+        current_date, documents = date.today(), []
+        for day in range(90, -1, -1):
+            publication_date = current_date - timedelta(days=day)
+            rnd = self._random('documents', document_type, document_category, publication_date)
+            for _ in range(self.config.documents_per_day):
+                document_id = str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+                document = {
+                    'documentId': document_id,
+                    'customer': f'C{rnd.randint(1, 10):03d}',
+                    'companyName': 'MOCK S.P.A.',
+                    'fineName': f'{document_type.lower()}_{document_id[:8]}.{extension}',
+                    'documentDate': (publication_date - timedelta(days=rnd.randint(0, 5))).isoformat(),
+                    'documentPublicationDate': publication_date.isoformat(),
+                    'documentType': {'name': document_type},
+                    'documentCategory': {'name': document_category} if document_category else None
+                }
+                if date_type and not date_from <= date.fromisoformat(document[date_type]) <= date_to: continue
+                documents.append(document)
+
+        with self._lock:
+            self._documents.update((document['documentId'], document['fineName']) for document in documents)
+        return documents
+
+    def get_document(self,
+                     document_id: str) -> tuple[str, bytes] | None:
+        """
+        Get the content of a document already listed, as random bytes of the document size.
+
+        :param document_id: The document id retrieved from search documents.
+        :type document_id: str
+        :return: A tuple with the document filename and content, or None if the document is unknown.
+        :rtype: tuple[str, bytes] | None
+        """
+        if not (filename := self._documents.get(document_id)): return None
+        return filename, self._random('content', document_id).randbytes(self.config.document_size)
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """
+    The _MockHandler object serves a request of the mock server, by routing it by the endpoint name in the URL path.
+    """
+    # keep the connections alive, as the HTTP session pool does with the real API
+    protocol_version = 'HTTP/1.1'
+    server: MockServer
+
+    def do_GET(self) -> None:
+        self._dispatch('GET')
+
+    def do_POST(self) -> None:
+        self._dispatch('POST')
+
+    def log_message(self,
+                    format: str,
+                    *args: Any) -> None:
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+    def _send_json(self,
+                   status: int,
+                   body: Any,
+                   headers: dict[str, str] = None) -> None:
+        """
+        Send a response with a JSON body.
+
+        :param status: The HTTP status of the response.
+        :type status: int
+        :param body: The body of the response, encoded as JSON.
+        :type body: Any
+        :param headers: The further headers of the response, defaults to None.
+        :type headers: dict[str, str]
+        """
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_error(self,
+                    status: HTTPStatus,
+                    message: str = None,
+                    headers: dict[str, str] = None) -> None:
+        self._send_json(status, {'status': status.value, 'message': message or status.phrase}, headers)
+
+    def _send_stream(self,
+                     items: Iterator[Any]) -> None:
+        """
+        Send a response with a JSON array body by chunks, encoding the items while they are generated.
+
+        :param items: The iterator of the array items.
+        :type items: Iterator[Any]
+        """
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write(content: str) -> None:
+            content = content.encode('utf-8')
+            self.wfile.write(f'{len(content):X}\r\n'.encode('ascii') + content + b'\r\n')
+
+        batch, separator = [], '['
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.server.config.chunk_size:
+                write(separator + ','.join(json.dumps(var) for var in batch))
+                batch, separator = [], ','
+        write(separator + ','.join(json.dumps(var) for var in batch) + ']' if batch or separator == '[' else ']')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _dispatch(self,
+                  method: str) -> None:
+        """
+        Serve a request, by injecting the configured latency and faults before routing it to its endpoint.
+
+        :param method: The HTTP method of the request.
+        :type method: str
+        """
+        # the request body must be always read, to reuse the connection for the next request
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        config = self.server.config
+        if config.latency or config.jitter: time.sleep(config.latency + random.uniform(0, config.jitter))
+        if not self.server.throttle():
+            return self._send_error(HTTPStatus.TOO_MANY_REQUESTS, headers={'Retry-After': '1'})
+        if random.random() < config.error_rate:
+            return self._send_error(HTTPStatus.SERVICE_UNAVAILABLE)
+
+        parts = urlsplit(self.path).path.strip('/').split('/')
+        # the endpoint is found by name, so that the mock server can be reached with any base path
+        endpoint = next((idx for idx, part in enumerate(parts) if part in _ROUTES), None)
+        if endpoint is None or _ROUTES[parts[endpoint]][0] != method:
+            return self._send_error(HTTPStatus.NOT_FOUND)
+        name, args = parts[endpoint], parts[endpoint + 1:]
+
+        try:
+            body = json.loads(body) if body and name != 'token' else {}
+        except ValueError:
+            return self._send_error(HTTPStatus.BAD_REQUEST, 'the request body is not a valid JSON')
+        if name != 'token' and not self.server.check_token(self.headers.get('x-token')):
+            return self._send_error(HTTPStatus.UNAUTHORIZED, 'the token is missing or expired')
+        getattr(self, _ROUTES[name][1])(body, *args)
+
+    def _token(self,
+               body: dict[str, Any]) -> None:
+        auth = self.headers.get('Authorization', '')
+        try:
+            client_id, _ = base64.b64decode(auth.removeprefix('Basic ')).decode('utf-8').split(':', 1)
+        except ValueError:
+            client_id = None
+        if not auth.startswith('Basic ') or not client_id:
+            return self._send_error(HTTPStatus.UNAUTHORIZED, 'the client credentials are missing')
+        self._send_json(HTTPStatus.OK, self.server.login())
+
+    def _toll_groups(self,
+                     body: dict[str, Any]) -> None:
+        self._send_json(HTTPStatus.OK, self.server.get_toll_groups())
+
+    def _search_tolls(self,
+                      body: dict[str, Any]) -> None:
+        toll_genre = 'P' if self.path.rstrip('/').endswith('searchDailyTolls') else 'D'
+        filters = [date_type for date_type in ('tolls', 'acquisition', 'invoice') if body.get(date_type)]
+        if len(filters) != 1: return self._send_error(HTTPStatus.BAD_REQUEST, 'only one date filter must be specified')
+
+        try:
+            date_from = date.fromisoformat(body[filters[0]]['date_from'])
+            date_to = date.fromisoformat(body[filters[0]]['date_to'])
+        except (KeyError, TypeError, ValueError):
+            return self._send_error(HTTPStatus.BAD_REQUEST, 'the date filter is not valid')
+        if date_from < date.today() - timedelta(days=90):
+            return self._send_error(HTTPStatus.BAD_REQUEST, 'the date_from field cannot be older than 90 days')
+        elif abs(date_to - date_from) > timedelta(days=7):
+            return self._send_error(HTTPStatus.BAD_REQUEST, 'the interval between the dates cannot be greater than 7 days')
+        self._send_stream(self.server.search_tolls(toll_genre, body.get('tollsGroup') or [], filters[0], date_from, date_to))
+
+    def _documents(self,
+                   body: dict[str, Any],
+                   document_type: str = None,
+                   document_category: str = None) -> None:
+        if not document_type: return self._send_error(HTTPStatus.NOT_FOUND, 'the document type is missing')
+        filters = [date_type for date_type in ('documentDate', 'documentPublicationDate') if body.get(date_type)]
+        if len(filters) > 1: return self._send_error(HTTPStatus.BAD_REQUEST, 'only one date filter must be specified')
+
+        date_type, date_from, date_to = (filters[0], None, None) if filters else (None, None, None)
+        try:
+            if date_type:
+                date_from = date.fromisoformat(body[date_type]['date_from'])
+                date_to = date.fromisoformat(body[date_type]['date_to'])
+        except (KeyError, TypeError, ValueError):
+            return self._send_error(HTTPStatus.BAD_REQUEST, 'the date filter is not valid')
+        documents = self.server.search_documents(document_type, document_category, date_type, date_from, date_to)
+        self._send_json(HTTPStatus.OK, {'documents': documents})
+
+    def _download(self,
+                  body: dict[str, Any],
+                  document_id: str = None) -> None:
+        if not (document := self.server.get_document(document_id)):
+            return self._send_error(HTTPStatus.NOT_FOUND, 'the document is not found')
+        filename, content = document
+
+        # only the open ranges are sent by the client, to resume an interrupted download
+        status, offset = HTTPStatus.OK, 0
+        if match := re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', '')):
+            status, offset = HTTPStatus.PARTIAL_CONTENT, int(match.group(1))
+            if offset >= len(content):
+                return self._send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                                        headers={'Content-Range': f'bytes */{len(content)}'})
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(content) - offset))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {offset}-{len(content) - 1}/{len(content)}')
+        self.send_header('x-filename', filename)
+        self.end_headers()
+        self.wfile.write(content[offset:])
+
+
+# _ROUTES: the endpoints served by the mock server, by name with their method and handler
+_ROUTES = {
+    'token': ('POST', '_token'),
+    'getTollGroups': ('GET', '_toll_groups'),
+    'searchTolls': ('POST', '_search_tolls'),
+    'searchDailyTolls': ('POST', '_search_tolls'),
+    'findDocuments': ('POST', '_documents'),
+    'downloadDocumentByUuid': ('GET', '_download')
+}
+
+
+def main() -> None:
+    """
+    Start the mock server from command line, serving until interrupted.
+    """
+    defaults = MockConfig()
+    parser = argparse.ArgumentParser(description='Local stand-in of the FAI SERVICE API, for load testing the job.')
+    parser.add_argument('--host', default='127.0.0.1', help='the host to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on, 0 for a free one')
+    parser.add_argument('--seed', type=int, default=defaults.seed, help='the seed of the synthetic data')
+    parser.add_argument('--toll-groups', type=int, default=defaults.toll_groups, help='the number of tolling groups')
+    parser.add_argument('--tolls-per-day', type=int, default=defaults.tolls_per_day,
+                        help='the number of tolls acquired each day, for each genre')
+    parser.add_argument('--documents-per-day', type=int, default=defaults.documents_per_day,
+                        help='the number of documents published each day, for each type')
+    parser.add_argument('--document-size', type=int, default=defaults.document_size, help='the bytes of each document')
+    parser.add_argument('--token-ttl', type=int, default=defaults.token_ttl, help='the seconds a token is valid')
+    parser.add_argument('--latency', type=float, default=defaults.latency, help='the seconds each request is delayed')
+    parser.add_argument('--jitter', type=float, default=defaults.jitter,
+                        help='the maximum random seconds added to the latency')
+    parser.add_argument('--rate-limit', type=float, default=defaults.rate_limit,
+                        help='the requests per second allowed before answering 429, 0 for no limit')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate,
+                        help='the fraction of requests failed with 503, between 0 and 1')
+    args = vars(parser.parse_args())
+    host, port = args.pop('host'), args.pop('port')
+
+    with MockServer((host, port), MockConfig(**args)) as server:
+        logger.info('starting mock server on %s... (%s)', server.url, args)
+        print(f'serving on {server.url}, point the job to it with:\n'
+              f'  FEENOX_LOGIN_URL={server.url}/token FEENOX_API_URL={server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info('stopping mock server...')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,53 @@
-from dataclasses import astuple, dataclass, field
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field, fields
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from operator import attrgetter
+from pathlib import Path
+from queue import Empty, Full, Queue
+from time import perf_counter
+from typing import Any, Self
 
-from core import Querier, get_logger
-from .constants import (PATH_CFG, PATH_LOG, PATH_RES, QUERY_CHECK_DUPLICATE, QUERY_GET_DOCUMENTS,
-                        QUERY_GET_LAST_TOLL_DATE, QUERY_GET_TOLL_GROUPS, QUERY_INSERT_DOCUMENT,
-                        QUERY_INSERT_TOLL, QUERY_INSERT_TOLL_GROUPS)
+from core import Querier, QuerierPool, StatementStats, get_logger, metrics
+from . import constants
+from .constants import (PATH_CFG, PATH_LOG, PATH_RES, QUERY_CHECK_DOCUMENTS, QUERY_CHECK_DUPLICATES,
+                        QUERY_COUNT_TOLL_DUPLICATES_AVOIDED, QUERY_GET_DOCUMENT_CHECKPOINT, QUERY_GET_DOCUMENT_FAILURES,
+                        QUERY_GET_LAST_TOLL_ACQUISITION_DATE, QUERY_GET_LAST_TOLL_DATE, QUERY_GET_TOLL_CHECKPOINT,
+                        QUERY_GET_TOLL_GROUPS,
+                        QUERY_INSERT_DOCUMENT, QUERY_INSERT_TOLL, QUERY_INSERT_TOLL_GROUPS,
+                        QUERY_UPSERT_DOCUMENT_CHECKPOINT, QUERY_UPSERT_DOCUMENT_FAILURE, QUERY_UPSERT_TOLL_CHECKPOINT)
 from .feenox import Feenox
+from .toll_index import TollIndex
 
 feenox: Feenox = Feenox(PATH_CFG)
+# querier_pool: the database connections shared by all saving functions, to be closed at the end of the job
+querier_pool: QuerierPool = QuerierPool(PATH_CFG, save_changes=True)
 logger = get_logger(PATH_LOG, __name__)
 
+# _LAST_TOLL_DATE_QUERIES: the queries getting the latest saved toll date for each date type, when there isn't checkpoint
+_LAST_TOLL_DATE_QUERIES: dict[str, str] = {
+    'tolls': QUERY_GET_LAST_TOLL_DATE,
+    'acquisition': QUERY_GET_LAST_TOLL_ACQUISITION_DATE
+}
 
-@dataclass
+
+def _to_decimal(var: Any) -> Decimal:
+    """
+    Convert an amount retrieved from API call in decimal object, without conversion if already a decimal.
+
+    :param var: The amount to be converted, as decimal, float, integer or string.
+    :type var: Any
+    :return: The amount as decimal object.
+    :rtype: Decimal
+    """
+    return var if type(var) is Decimal else Decimal(str(var))
+
+
+@dataclass(slots=True)
 class Toll:
     """
     The Toll object represents all the information retrieved from daily and invoice tolling search.
@@ -49,13 +84,15 @@ class Toll:
     invoice_article: str | None
     invoice_number: str | None
     invoice_date: datetime | None
-    global_identifier: str = field(init=False)
+    # global_identifier: generated from the other fields if not passed, an empty string defers the generation
+    global_identifier: str = field(default=None, kw_only=True)
     recording_date: datetime
 
     def __post_init__(self) -> None:
         """
         Generate the global identifier from the stored toll information passed to the class constructor.
         """
+        if self.global_identifier is not None: return
         self.global_identifier = '#'.join(
             var.strftime('%Y%m%d%H%M%S')
             if isinstance(var, datetime)
@@ -85,8 +122,98 @@ class Toll:
             ) if var is not None
         )
 
+    @classmethod
+    def from_item(cls,
+                  item: dict[str, Any],
+                  toll_genre: str,
+                  recording_date: datetime,
+                  global_identifier: str = None) -> Self:
+        """
+        Create the toll from a tolling detail retrieved from daily or invoice tolling search.
+
+        :param item: The tolling detail retrieved from API call.
+        :type item: dict[str, Any]
+        :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
+        :type toll_genre: str
+        :param recording_date: The timestamp of the toll saving.
+        :type recording_date: datetime
+        :param global_identifier: The global identifier of the toll, defaults to the generated one.
+        :type global_identifier: str
+        :return: The new toll object.
+        :rtype: Toll
+        """
+        # convert date field in datetime object and amount field in decimal object
+        is_invoice = toll_genre == 'D'
+        return cls(
+            item['id'],
+            item['nation'],
+            item['toll_group_code'],
+            item['type'],
+            item['filename'] if toll_genre == 'P' else None,
+            datetime.fromisoformat(item['acquisition_date']),
+            item['customer_code'],
+            item['contract_code'],
+            item['sign_of_transaction'],
+            _to_decimal(item['amount_no_vat']),
+            _to_decimal(item['amount_including_vat']),
+            _to_decimal(item['vat']),
+            item['currency_code'],
+            _to_decimal(item['exchange_rate']) if item['exchange_rate'] else None,
+            item['network_code'],
+            item['entry_global_gate_identifier'],
+            item['entry_global_gate_identifier_description'],
+            datetime.fromisoformat(item['entry_timestamp']) if item['entry_timestamp'] else None,
+            item['exit_global_gate_identifier'],
+            item['exit_global_gate_identifier_description'],
+            datetime.fromisoformat(item['exit_timestamp']),
+            _to_decimal(item['km']) if item['km'] else None,
+            item['device_type'],
+            item['obu'],
+            item['pan_number'],
+            item['vehicle_plate'],
+            item['vehicle_country'],
+            item['vehicle_euro_class'],
+            item['vehicle_tariff_class'],
+            item['invoice_article'] if is_invoice else None,
+            item['invoice_nr'] if is_invoice else None,
+            datetime.fromisoformat(item['invoice_date']) if is_invoice else None,
+            recording_date,
+            global_identifier=global_identifier
+        )
+
+    @classmethod
+    def from_items(cls,
+                   items: Iterable[dict[str, Any]],
+                   toll_genre: str,
+                   recording_date: datetime) -> list[Self]:
+        """
+        Create the tolls from a list of tolling details, by generating all their global identifiers in one go.
 
-@dataclass
+        :param items: The tolling details retrieved from API call.
+        :type items: Iterable[dict[str, Any]]
+        :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
+        :type toll_genre: str
+        :param recording_date: The timestamp of the tolls saving.
+        :type recording_date: datetime
+        :return: The list of new toll objects.
+        :rtype: list[Toll]
+        """
+        tolls = [cls.from_item(item, toll_genre, recording_date, '') for item in items]
+        for toll, global_identifier in zip(tolls, build_global_identifiers(tolls)):
+            toll.global_identifier = global_identifier
+        return tolls
+
+    def params(self) -> tuple:
+        """
+        Get the toll fields as parameters tuple for the insert query, without copying them.
+
+        :return: The toll fields in the same order of the insert query.
+        :rtype: tuple
+        """
+        return _TOLL_PARAMS(self)
+
+
+@dataclass(slots=True)
 class Document:
     """
     The Document object represents all the information retrieved from document search.
@@ -101,109 +228,834 @@ class Document:
     document_category: str | None
     recording_date: datetime
 
+    @classmethod
+    def from_item(cls,
+                  item: dict[str, Any],
+                  recording_date: datetime) -> Self:
+        """
+        Create the document from a document detail retrieved from document search.
+
+        :param item: The document detail retrieved from API call.
+        :type item: dict[str, Any]
+        :param recording_date: The timestamp of the document saving.
+        :type recording_date: datetime
+        :return: The new document object.
+        :rtype: Document
+        """
+        # convert date field in date object
+        return cls(
+            item['documentId'],
+            item['customer'],
+            item['companyName'],
+            item['fineName'],
+            date.fromisoformat(item['documentDate']),
+            date.fromisoformat(item['documentPublicationDate']),
+            item['documentType']['name'],
+            item['documentCategory']['name'] if item['documentCategory'] else None,
+            recording_date
+        )
+
+    def params(self) -> tuple:
+        """
+        Get the document fields as parameters tuple for the insert query, without copying them.
+
+        :return: The document fields in the same order of the insert query.
+        :rtype: tuple
+        """
+        return _DOCUMENT_PARAMS(self)
+
+
+# _TOLL_PARAMS and _DOCUMENT_PARAMS: getters of all fields at once, replacing the deep copy done by astuple
+_TOLL_PARAMS = attrgetter(*(var.name for var in fields(Toll)))
+_DOCUMENT_PARAMS = attrgetter(*(var.name for var in fields(Document)))
+
+# _GLOBAL_IDENTIFIER_FIELDS: the toll fields joined in the global identifier, in the same order of Toll.__post_init__
+_GLOBAL_IDENTIFIER_FIELDS = (
+    'toll_group',
+    'toll_genre',
+    'acquisition_date',
+    'customer_code',
+    'contract_code',
+    'sign_of_transaction',
+    'net_amount',
+    'gross_amount',
+    'vat_rate',
+    'exchange_rate',
+    'network_code',
+    'entry_gate_code',
+    'entry_date',
+    'exit_gate_code',
+    'exit_date',
+    'device_serial_number',
+    'device_service_pan',
+    'invoice_number',
+    'invoice_date'
+)
+_QUANTUM = Decimal('1e-5')
+
+
+def _format_identifier(var: Any) -> str:
+    """
+    Format a toll field for the global identifier, as done by Toll.__post_init__.
+
+    :param var: The toll field value, not None.
+    :type var: Any
+    :return: The formatted value.
+    :rtype: str
+    """
+    if isinstance(var, datetime):
+        # the strftime doesn't pad years before 1000, so the fast formatting is used only after it
+        return (f'{var.year:04d}{var.month:02d}{var.day:02d}{var.hour:02d}{var.minute:02d}{var.second:02d}'
+                if var.year >= 1000 else var.strftime('%Y%m%d%H%M%S'))
+    elif isinstance(var, Decimal):
+        return str(var.quantize(_QUANTUM)).replace('.', '').rjust(11, '0')
+    return str(var)
+
+
+def build_global_identifiers(tolls: Sequence[Toll]) -> list[str]:
+    """
+    Generate the global identifiers of a list of tolls, by formatting their fields column by column.
+    The result is the same of the global identifier generated by Toll.__post_init__ for each toll.
+
+    :param tolls: The list of tolls.
+    :type tolls: Sequence[Toll]
+    :return: The list of global identifiers, in the same order of input.
+    :rtype: list[str]
+    """
+    columns = []
+    for name in _GLOBAL_IDENTIFIER_FIELDS:
+        column = list(map(attrgetter(name), tolls))
+        # the string columns are already formatted, so skip the per value formatting
+        columns.append(column if all(type(var) is str or var is None for var in column) else [
+            None if var is None else _format_identifier(var) for var in column
+        ])
+    return ['#'.join([var for var in row if var is not None]) for row in zip(*columns)]
+
+
+def _fetch_in_batches(querier: Querier,
+                      query: str,
+                      params: Sequence[Any | tuple],
+                      batch_size: int = 500) -> Iterator[Any]:
+    """
+    Run a query template in batches of parameters, by filling its values placeholder for each batch,
+    with a placeholder for each single parameter or with a row of placeholders for each tuple of parameters.
+
+    :param querier: The Querier object connected to the database.
+    :type querier: Querier
+    :param query: The query string with the values placeholder.
+    :type query: str
+    :param params: The list of parameters, as single values or as tuples of the same size.
+    :type params: Sequence[Any | tuple]
+    :param batch_size: The number of parameters sent for each query, defaults to 500.
+    :type batch_size: int
+    :return: An iterator of the rows fetched by all the batches.
+    :rtype: Iterator[Any]
+    """
+    for offset in range(0, len(params), batch_size):
+        batch = params[offset:offset + batch_size]
+        if isinstance(batch[0], tuple):
+            values = ', '.join([f"({', '.join(['?'] * len(batch[0]))})"] * len(batch))
+            batch = [var for item in batch for var in item]
+        else:
+            values = ', '.join(['?'] * len(batch))
+        yield from querier.run(query.format(values=values), batch).fetch(Querier.FETCH_ALL)
+
+
+def _check_duplicates(querier: Querier,
+                      tolls: list[Toll],
+                      batch_size: int = 500,
+                      index: TollIndex = None) -> list[Toll]:
+    """
+    Check a list of tolls against the database in batches, discarding the ones already saved or duplicated.
+    Every discarded toll will be logged as warning for id duplicate and as error for global identifier duplicate.
+
+    :param querier: The Querier object connected to the database.
+    :type querier: Querier
+    :param tolls: The list of tolls to be checked.
+    :type tolls: list[Toll]
+    :param batch_size: The number of tolls checked for each query, defaults to 500.
+    :type batch_size: int
+    :param index: The index of the tolls already saved, checked before the database, defaults to None.
+    :type index: TollIndex
+    :return: The list of tolls not yet saved on database, in the same order of input.
+    :rtype: list[Toll]
+    """
+    ids, global_identifiers = (index.ids, index.global_identifiers) if index is not None else (set(), set())
+    # only the tolls not found in the index could be new, so check on database just them
+    candidates = [toll for toll in tolls if toll.id not in ids and toll.global_identifier not in global_identifiers]
+
+    duplicates: dict[tuple[str, str], tuple[int, int]] = {
+        (row.id, row.global_identifier): (row.nr_id, row.nr_global_identifier)
+        for row in _fetch_in_batches(querier, QUERY_CHECK_DUPLICATES,
+                                     [(toll.id, toll.global_identifier) for toll in candidates], batch_size)
+    }
+
+    res, new_ids, new_global_identifiers = [], set(), set()
+    for toll in tolls:
+        nr_id, nr_global_identifier = duplicates.get((toll.id, toll.global_identifier), (0, 0))
+        # the check is done also against the previous tolls of the same list, as they were already saved
+        if nr_id or toll.id in ids or toll.id in new_ids:
+            # duplicate on id field is ok, means that row is already saved
+            logger.warning('discarding toll for error on CHECK_DUPLICATE... id already saved! (%s)', toll.id)
+        elif (nr_global_identifier or toll.global_identifier in global_identifiers
+              or toll.global_identifier in new_global_identifiers):
+            # duplicate on global identifier means that row is really a duplicate
+            logger.error('discarding toll for error on CHECK_DUPLICATE... global identifier already saved! (%s)', toll.global_identifier)
+        else:
+            res.append(toll)
+            new_ids.add(toll.id)
+            new_global_identifiers.add(toll.global_identifier)
+    return res
+
+
+def _check_documents(querier: Querier,
+                     document_ids: list[str],
+                     batch_size: int = 500) -> set[str]:
+    """
+    Check a list of document ids against the database in batches, by sending only the ids to be checked.
+
+    :param querier: The Querier object connected to the database.
+    :type querier: Querier
+    :param document_ids: The list of document ids to be checked.
+    :type document_ids: list[str]
+    :param batch_size: The number of ids checked for each query, defaults to 500.
+    :type batch_size: int
+    :return: The set of document ids already saved on database.
+    :rtype: set[str]
+    """
+    return {row.id for row in _fetch_in_batches(querier, QUERY_CHECK_DOCUMENTS, document_ids, batch_size)}
+
+
+def _get_document_failures(querier: Querier,
+                           document_ids: list[str],
+                           batch_size: int = 500) -> dict[str, int]:
+    """
+    Get the number of failed downloads in the previous runs of a list of document ids, by checking them in batches.
+
+    :param querier: The Querier object connected to the database.
+    :type querier: Querier
+    :param document_ids: The list of document ids to be checked.
+    :type document_ids: list[str]
+    :param batch_size: The number of ids checked for each query, defaults to 500.
+    :type batch_size: int
+    :return: The number of failed downloads by document id, only for the documents failed at least once.
+    :rtype: dict[str, int]
+    """
+    rows = _fetch_in_batches(querier, QUERY_GET_DOCUMENT_FAILURES, document_ids, batch_size)
+    return {row.id: row.nr_failures for row in rows}
+
+
+def _get_checkpoint(querier: Querier,
+                    toll_genre: str,
+                    date_type: str = 'tolls',
+                    overlap: int = 0) -> date:
+    """
+    Get the date to start the toll search from, as the end of the last window fully saved on database.
+    Without a checkpoint the search starts from the latest saved toll date of the same type, or from the last 90 days at most.
+
+    :param querier: The Querier object connected to the database.
+    :type querier: Querier
+    :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
+    :type toll_genre: str
+    :param date_type: The date type of the search windows, as tolls, acquisition or invoice, defaults to 'tolls'.
+    :type date_type: str
+    :param overlap: The days searched again before the checkpoint, to catch the tolls arrived late, defaults to 0.
+    :type overlap: int
+    :return: The date to start the toll search from.
+    :rtype: date
+    """
+    current_date = date.today()
+    if date_from := querier.run(QUERY_GET_TOLL_CHECKPOINT, toll_genre, date_type).fetch(Querier.FETCH_VAL):
+        logger.info('starting toll search from latest saved window of %s date... (%s)', date_type, date_from)
+    elif ((query := _LAST_TOLL_DATE_QUERIES.get(date_type))
+          and (date_from := querier.run(query, toll_genre).fetch(Querier.FETCH_VAL))):
+        logger.info('no toll checkpoint found... starting toll search from latest saved toll %s date (%s)', date_type, date_from)
+    # the checkpoint is a date, while the latest saved toll date is a timestamp
+    if isinstance(date_from, datetime): date_from = date_from.date()
+    if date_from and overlap: date_from -= timedelta(days=overlap)
+
+    # the API doesn't allow searching tolls older than 90 days
+    if not date_from or not current_date - timedelta(days=90) <= date_from <= current_date:
+        date_from = current_date - timedelta(days=90)
+        logger.info('invalid or empty latest saved toll date... starting search from last 90 days (%s)', date_from)
+    return date_from
+
+
+def _count_duplicates_avoided(querier: Querier,
+                              toll_genre: str,
+                              date_from: date,
+                              overlap: int = 0) -> int:
+    """
+    Count the tolls saved before the search start on acquisition date, which a search on tolls date would retrieve again.
+    The search on tolls date would start from its checkpoint, or from the latest saved toll exit date,
+    and it would retrieve again the tolls with a later exit date but acquired before the search start.
+
+    :param querier: The Querier object connected to the database.
+    :type querier: Querier
+    :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
+    :type toll_genre: str
+    :param date_from: The start date of the search on acquisition date.
+    :type date_from: date
+    :param overlap: The days searched again before the checkpoint, defaults to 0.
+    :type overlap: int
+    :return: The number of tolls not retrieved again by searching on acquisition date.
+    :rtype: int
+    """
+    if not (tolls_from := querier.run(QUERY_GET_TOLL_CHECKPOINT, toll_genre, 'tolls').fetch(Querier.FETCH_VAL)
+                          or querier.run(QUERY_GET_LAST_TOLL_DATE, toll_genre).fetch(Querier.FETCH_VAL)):
+        return 0
+    if isinstance(tolls_from, datetime): tolls_from = tolls_from.date()
+    # the same start of _get_checkpoint, within the last 90 days allowed by the API
+    tolls_from = max(tolls_from - timedelta(days=overlap), date.today() - timedelta(days=90))
+    return querier.run(QUERY_COUNT_TOLL_DUPLICATES_AVOIDED, toll_genre, datetime.combine(tolls_from, datetime.min.time()),
+                       datetime.combine(date_from, datetime.min.time())).fetch(Querier.FETCH_VAL) or 0
+
+
+def _get_tolls(toll_genre: str,
+               windows: list[tuple[date, date]],
+               workers: int = 1,
+               batch_size: int = 1000,
+               date_type: str = 'tolls',
+               prefetch: int = 4) -> Iterator[tuple[date, date, Iterable[list[dict[str, Any]]]]]:
+    """
+    Retrieve the tolls of each date window from API call, by fetching up to workers windows concurrently.
+    The windows are returned in the same order of input, even if their API calls complete in a different order.
+    The tolls are always streamed from the API response: a window fetched concurrently passes its batches through
+    a bounded queue, so that only up to prefetch batches of each window are kept in memory while waiting.
+
+    :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
+    :type toll_genre: str
+    :param windows: The list of date windows to be searched, with maximum 7 days interval each.
+    :type windows: list[tuple[date, date]]
+    :param workers: The maximum number of concurrent API calls, defaults to 1.
+    :type workers: int
+    :param batch_size: The number of tolls retrieved together as a list, defaults to 1000.
+    :type batch_size: int
+    :param date_type: The date type of the windows, as tolls, acquisition or invoice, defaults to 'tolls'.
+    :type date_type: str
+    :param prefetch: The maximum number of batches of each window fetched concurrently kept in memory, defaults to 4.
+    :type prefetch: int
+    :return: An iterator of tuples with the window dates and the batches of retrieved tolls.
+    :rtype: Iterator[tuple[date, date, Iterable[list[dict[str, Any]]]]]
+    """
+    search_tolls = feenox.iter_invoice_tolls if toll_genre == 'D' else feenox.iter_daily_tolls
+
+    def iter_tolls(window: tuple[date, date]) -> Iterator[list[dict[str, Any]]]:
+        return search_tolls(batch_size=batch_size, **{f'{date_type}_date': window})
+
+    if workers == 1:
+        for window in windows:
+            yield *window, iter_tolls(window)
+        return
+
+    # the end of each window is marked by None, or by the error raised by its API call
+    stopped = threading.Event()
+
+    def put(batches: Queue, item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+            except Full:
+                continue
+            return True
+        return False
+
+    def fetch_tolls(window: tuple[date, date], batches: Queue) -> None:
+        try:
+            for batch in iter_tolls(window):
+                # the worker waits while the window is not yet consumed, until the search is stopped
+                if not put(batches, batch): return
+        except Exception as exc:
+            put(batches, exc)
+        else:
+            put(batches, None)
+
+    def iter_batches(batches: Queue) -> Iterator[list[dict[str, Any]]]:
+        while (batch := batches.get()) is not None:
+            if isinstance(batch, Exception): raise batch
+            yield batch
+
+    queues = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for window in windows:
+                queues.append((window, batches := Queue(prefetch)))
+                executor.submit(fetch_tolls, window, batches)
+                # keep fetching the following windows up to the workers limit, while the first one is processed
+                if len(queues) >= workers:
+                    window, batches = queues.popleft()
+                    yield *window, iter_batches(batches)
+            while queues:
+                window, batches = queues.popleft()
+                yield *window, iter_batches(batches)
+        finally:
+            # release the workers waiting on a full queue, if the search is interrupted
+            stopped.set()
+
+
+def _download_documents(documents: list[Document],
+                        executor: ThreadPoolExecutor) -> list[tuple[Document, Path]]:
+    """
+    Download the files of a list of documents concurrently on the executor workers.
+    Every failed download will be logged as error and discarded from the result.
+
+    :param documents: The list of documents to be downloaded.
+    :type documents: list[Document]
+    :param executor: The executor whose workers download the files.
+    :type executor: ThreadPoolExecutor
+    :return: The list of downloaded documents with their file path, in the same order of input.
+    :rtype: list[tuple[Document, Path]]
+    """
+    futures = [(document, executor.submit(feenox.download_document, document.id, PATH_RES)) for document in documents]
+
+    res = []
+    for document, future in futures:
+        try:
+            fou = future.result()
+        except Exception as exc:
+            logger.error('error on downloading document with id %s... discarding document! (%s)', document.id, exc)
+        else:
+            logger.info('downloaded document locally (%s)', fou.as_posix())
+            res.append((document, fou))
+    return res
+
 
 def save_toll_groups() -> None:
     """
     Saves all new toll groups retrieved from API call and not yet saved on database.
     """
-    querier: Querier = Querier(PATH_CFG, save_changes=True)
-    response = feenox.get_toll_groups()
-    toll_groups = [var.code for var in querier.run(QUERY_GET_TOLL_GROUPS)]
+    with querier_pool.checkout() as querier:
+        response = feenox.get_toll_groups()
+        toll_groups = [var.code for var in querier.run(QUERY_GET_TOLL_GROUPS)]
+
+        items = [item for item in response if item['tollsGroup'] not in toll_groups]
+        if items: logger.info('found %d new toll groups %s', len(items), [item['tollsGroup'] for item in items])
+        else: logger.info('no new toll group found... %d records already saved on database', len(toll_groups))
+
+        for item in items:
+            querier.run(QUERY_INSERT_TOLL_GROUPS, item['tollsGroup'], item['tollsGroupDescription'].strip().upper())
+
+
+class _TollPipeline:
+    """
+    The _TollPipeline object saves the tolls through the stages fetch, parse, dedup and write, linked by bounded queues,
+    so that the API calls, the tolls conversion and the database writes overlap.
+    Each stage waits when its output queue is full, and the time spent by each stage working and waiting is measured
+    to find the bottleneck: a stage waiting for its input is faster than the previous one.
+    The checkpoint of a window is saved once all its batches are written, in the same order of the windows.
+    """
+    # _END: the item closing a queue, one for each worker of the next stage
+    _END: object = object()
+
+    def __init__(self,
+                 toll_genre: str,
+                 date_type: str,
+                 windows: list[tuple[date, date]],
+                 job_begin: datetime,
+                 index: TollIndex = None,
+                 queue_size: int = 4) -> None:
+        """
+        Initialize the pipeline of the search windows, without starting it.
+
+        :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
+        :type toll_genre: str
+        :param date_type: The date type of the windows, as tolls, acquisition or invoice.
+        :type date_type: str
+        :param windows: The list of date windows to be searched.
+        :type windows: list[tuple[date, date]]
+        :param job_begin: The timestamp of the job starting.
+        :type job_begin: datetime
+        :param index: The index of the tolls already saved, updated with the new ones, defaults to a new empty one.
+        :type index: TollIndex
+        :param queue_size: The maximum number of batches waiting between two stages, defaults to 4.
+        :type queue_size: int
+        """
+        self.toll_genre, self.date_type, self.windows, self.job_begin = toll_genre, date_type, windows, job_begin
+        # the dedup stage adds the tolls to the index before they are written, to discard them from the following batches
+        self.index: TollIndex = index if index is not None else TollIndex(toll_genre, date_type)
+        self.queue_size: int = queue_size
+
+        self._lock: threading.Lock = threading.Lock()
+        self._stopped: threading.Event = threading.Event()
+        self._errors: list[BaseException] = []
+        # _stages: the seconds spent by each stage working, waiting for input and waiting for output
+        self._stages: dict[str, list[float]] = {}
+
+        # _pending: the batches of each window not yet written, _found: the records of each window completely fetched
+        self._pending: list[int] = [0] * len(windows)
+        self._found: list[int | None] = [None] * len(windows)
+        self._duplicates: list[int] = [0] * len(windows)
+        self._begin: list[float] = [perf_counter()] * len(windows)
+        self._next: int = 0
+        self.nr_total, self.nr_duplicates = 0, 0
+
+    def _measure(self,
+                 stage: str,
+                 kind: int,
+                 seconds: float) -> None:
+        """
+        Add the seconds spent by a stage to its measures, shared by all the workers of the stage.
+
+        :param stage: The stage name.
+        :type stage: str
+        :param kind: The measure index, 0 working, 1 waiting for input and 2 waiting for output.
+        :type kind: int
+        :param seconds: The seconds spent.
+        :type seconds: float
+        """
+        with self._lock:
+            self._stages.setdefault(stage, [0.0, 0.0, 0.0])[kind] += seconds
 
-    items = [item for item in response if item['tollsGroup'] not in toll_groups]
-    if items: logger.info('found %d new toll groups %s', len(items), [item['tollsGroup'] for item in items])
-    else: logger.info('no new toll group found... %d records already saved on database', len(toll_groups))
+    def _get(self,
+             source: Queue,
+             stage: str) -> Any:
+        """
+        Take the next item from a queue, by waiting until the pipeline is stopped.
+
+        :param source: The input queue of the stage.
+        :type source: Queue
+        :param stage: The stage name.
+        :type stage: str
+        :return: The next item, or _END if the pipeline is stopped.
+        :rtype: Any
+        """
+        begin = perf_counter()
+        while not self._stopped.is_set():
+            try:
+                item = source.get(timeout=0.1)
+            except Empty:
+                continue
+            self._measure(stage, 1, perf_counter() - begin)
+            return item
+        return _TollPipeline._END
 
-    for item in items:
-        querier.run(QUERY_INSERT_TOLL_GROUPS, item['tollsGroup'], item['tollsGroupDescription'].strip().upper())
-    del querier
+    def _put(self,
+             target: Queue,
+             item: Any,
+             stage: str) -> bool:
+        """
+        Put an item into a queue, by waiting while the queue is full until the pipeline is stopped.
+
+        :param target: The output queue of the stage.
+        :type target: Queue
+        :param item: The item to be put.
+        :type item: Any
+        :param stage: The stage name.
+        :type stage: str
+        :return: True if the item is put, False if the pipeline is stopped.
+        :rtype: bool
+        """
+        begin = perf_counter()
+        while not self._stopped.is_set():
+            try:
+                target.put(item, timeout=0.1)
+            except Full:
+                continue
+            self._measure(stage, 2, perf_counter() - begin)
+            return True
+        return False
+
+    def _worker(self,
+                stage: str,
+                func: Callable[[Any, Querier | None], Any],
+                source: Queue,
+                target: Queue | None,
+                remaining: list[int],
+                next_workers: int,
+                database: bool = False) -> None:
+        """
+        Run a worker of a stage, by applying the function to each input item and putting its result into the output queue.
+        The last worker of the stage ending closes the output queue, and any error stops the whole pipeline.
+
+        :param stage: The stage name.
+        :type stage: str
+        :param func: The function applied to each item with the worker Querier object, returning None to skip the output.
+        :type func: Callable[[Any, Querier | None], Any]
+        :param source: The input queue of the stage.
+        :type source: Queue
+        :param target: The output queue of the stage, None for the last stage.
+        :type target: Queue | None
+        :param remaining: The number of workers of the stage still running, shared by them.
+        :type remaining: list[int]
+        :param next_workers: The number of workers of the next stage.
+        :type next_workers: int
+        :param database: Enable or disable a connection to the database for the worker, defaults to False.
+        :type database: bool
+        """
+        try:
+            with querier_pool.checkout() if database else nullcontext() as querier:
+                while (item := self._get(source, stage)) is not _TollPipeline._END:
+                    begin = perf_counter()
+                    res = func(item, querier)
+                    self._measure(stage, 0, perf_counter() - begin)
+                    if target is not None and res is not None and not self._put(target, res, stage): break
+        except BaseException as exc:
+            self._errors.append(exc)
+            self._stopped.set()
+        finally:
+            with self._lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last and target is not None:
+                for _ in range(next_workers): self._put(target, _TollPipeline._END, stage)
+
+    def _flush(self,
+               querier: Querier) -> None:
+        """
+        Save the checkpoint of the windows completely written, in the same order of the windows, must be called under lock.
+
+        :param querier: The Querier object connected to the database.
+        :type querier: Querier
+        """
+        while self._next < len(self.windows) and self._found[self._next] is not None and not self._pending[self._next]:
+            (date_from, date_to), nr_items, nr_duplicates = self.windows[self._next], self._found[self._next], self._duplicates[self._next]
+            logger.info('searching toll of genre %s by %s date from %s to %s... found %d records, %d duplicates encountered.',
+                        self.toll_genre, self.date_type, date_from, date_to, nr_items, nr_duplicates)
+            # the window is saved entirely, so a following run resumes from its end even after a failure
+            querier.run(QUERY_UPSERT_TOLL_CHECKPOINT, self.toll_genre, self.date_type, date_from, date_to,
+                        nr_items, nr_duplicates, self.job_begin)
+            self.nr_total, self.nr_duplicates = self.nr_total + nr_items, self.nr_duplicates + nr_duplicates
+
+            # the window time includes its API call, or the wait for it if fetched concurrently
+            metrics.observe('toll_window', perf_counter() - self._begin[self._next], nr_items,
+                            toll_genre=self.toll_genre, date_type=self.date_type)
+            metrics.count('tolls_found', nr_items, toll_genre=self.toll_genre)
+            metrics.count('tolls_duplicates_encountered', nr_duplicates, toll_genre=self.toll_genre)
+            self._next += 1
+            if self._next < len(self.windows): self._begin[self._next] = perf_counter()
+
+    def _done(self,
+              window: int,
+              querier: Querier) -> None:
+        """
+        Mark a batch of a window as written, by saving the checkpoint of the windows completed.
+
+        :param window: The window index.
+        :type window: int
+        :param querier: The Querier object connected to the database.
+        :type querier: Querier
+        """
+        with self._lock:
+            self._pending[window] -= 1
+            self._flush(querier)
+
+    def _parse(self,
+               item: tuple[int, list[dict[str, Any]]],
+               querier: Querier | None) -> tuple[int, list[Toll]]:
+        """
+        Convert a batch of tolling details into Toll objects.
+
+        :param item: The window index and the batch of tolling details retrieved from API call.
+        :type item: tuple[int, list[dict[str, Any]]]
+        :param querier: Not used, the stage has no connection to the database.
+        :type querier: Querier | None
+        :return: The window index and the Toll objects.
+        :rtype: tuple[int, list[Toll]]
+        """
+        window, items = item
+        with metrics.timer('toll_convert', len(items), toll_genre=self.toll_genre):
+            return window, Toll.from_items(items, self.toll_genre, self.job_begin)
+
+    def _dedup(self,
+               item: tuple[int, list[Toll]],
+               querier: Querier) -> tuple[int, list[Toll]] | None:
+        """
+        Discard the tolls already saved or already passed through the stage, by adding the new ones to the index.
+
+        :param item: The window index and the batch of Toll objects.
+        :type item: tuple[int, list[Toll]]
+        :param querier: The Querier object connected to the database.
+        :type querier: Querier
+        :return: The window index and the new Toll objects, or None if all are duplicates and the batch is done.
+        :rtype: tuple[int, list[Toll]] | None
+        """
+        window, tolls = item
+        with metrics.timer('toll_check_duplicates', len(tolls), toll_genre=self.toll_genre):
+            new_tolls = _check_duplicates(querier, tolls, index=self.index)
+        for toll in new_tolls: self.index.add(toll.id, toll.global_identifier, getattr(toll, self.index.date_column))
+        with self._lock:
+            self._duplicates[window] += len(tolls) - len(new_tolls)
+        if new_tolls: return window, new_tolls
+        # nothing to be written, so the batch is already done
+        self._done(window, querier)
+        return None
+
+    def _write(self,
+               item: tuple[int, list[Toll]],
+               querier: Querier) -> None:
+        """
+        Save a batch of new tolls, by marking it as written for the checkpoint of its window.
+
+        :param item: The window index and the batch of new Toll objects.
+        :type item: tuple[int, list[Toll]]
+        :param querier: The Querier object connected to the database.
+        :type querier: Querier
+        """
+        window, tolls = item
+        with metrics.timer('toll_insert', len(tolls), toll_genre=self.toll_genre):
+            querier.run_many(QUERY_INSERT_TOLL, (toll.params() for toll in tolls))
+        logger.info('saved %d new tolls in %d batches %s', querier.rows, len(querier.batch_rows), querier.batch_rows)
+        self._done(window, querier)
+
+    def run(self,
+            querier: Querier,
+            workers: int = 1,
+            batch_size: int = 1000,
+            parse_workers: int = 1,
+            write_workers: int = 1) -> None:
+        """
+        Run the pipeline until all windows are saved, by fetching the tolls in the current thread.
+        The dedup stage has a single worker, so that the same toll can't pass it twice, and it uses its own connection
+        as each write worker does.
+
+        :param querier: The Querier object connected to the database, used for the checkpoint of the empty windows.
+        :type querier: Querier
+        :param workers: The maximum number of windows fetched concurrently, defaults to 1.
+        :type workers: int
+        :param batch_size: The number of tolls passed together through the stages, defaults to 1000.
+        :type batch_size: int
+        :param parse_workers: The number of workers converting the tolls, defaults to 1.
+        :type parse_workers: int
+        :param write_workers: The number of workers writing the tolls on database, defaults to 1.
+        :type write_workers: int
+        :raise Exception: The first error raised by a stage, after stopping all the others.
+        """
+        # the caller, the dedup worker and the write workers keep a connection each for the whole run
+        if write_workers + 2 > querier_pool.max_size:
+            write_workers = max(querier_pool.max_size - 2, 1)
+            logger.warning('too many toll write workers for the database connections... using %d workers', write_workers)
+
+        to_parse, to_dedup, to_write = (Queue(self.queue_size) for _ in range(3))
+        stages = (
+            ('parse', self._parse, to_parse, to_dedup, parse_workers, 1, False),
+            ('dedup', self._dedup, to_dedup, to_write, 1, write_workers, True),
+            ('write', self._write, to_write, None, write_workers, 0, True)
+        )
+        threads = []
+        for stage, func, source, target, nr_workers, next_workers, database in stages:
+            remaining = [nr_workers]
+            threads.extend(
+                threading.Thread(target=self._worker, name=f'toll_{stage}_{nr_worker}',
+                                 args=(stage, func, source, target, remaining, next_workers, database))
+                for nr_worker in range(nr_workers)
+            )
+        for thread in threads: thread.start()
+
+        tolls = _get_tolls(self.toll_genre, self.windows, workers, batch_size, self.date_type, self.queue_size)
+        try:
+            begin = perf_counter()
+            for window, (date_from, date_to, batches) in enumerate(tolls):
+                nr_items = 0
+                for items in batches:
+                    self._measure('fetch', 0, perf_counter() - begin)
+                    nr_items += len(items)
+                    with self._lock:
+                        self._pending[window] += 1
+                    if not self._put(to_parse, (window, items), 'fetch'): break
+                    begin = perf_counter()
+                if self._stopped.is_set(): break
+                with self._lock:
+                    self._found[window] = nr_items
+                    self._flush(querier)
+        except BaseException as exc:
+            self._errors.append(exc)
+            self._stopped.set()
+        finally:
+            # stop the windows still being fetched, as they are no more consumed after an error
+            tolls.close()
+            for _ in range(parse_workers): self._put(to_parse, _TollPipeline._END, 'fetch')
+            for thread in threads: thread.join()
+
+        for stage, (working, waiting_input, waiting_output) in self._stages.items():
+            logger.info('toll pipeline stage %s... working %.3f s, waiting input %.3f s, waiting output %.3f s',
+                        stage, working, waiting_input, waiting_output)
+            metrics.count('toll_pipeline_seconds', working, stage=stage, state='working')
+            metrics.count('toll_pipeline_seconds', waiting_input, stage=stage, state='waiting_input')
+            metrics.count('toll_pipeline_seconds', waiting_output, stage=stage, state='waiting_output')
+        if self._errors: raise self._errors[0]
 
 
 def save_tolls(toll_genre: str,
-               job_begin: datetime = datetime.now()) -> None:
+               job_begin: datetime = datetime.now(),
+               workers: int = 1,
+               batch_size: int = 1000,
+               use_index: bool = False,
+               date_type: str = 'tolls',
+               overlap: int = 0,
+               parse_workers: int = 1,
+               write_workers: int = 1,
+               queue_size: int = 4) -> None:
     """
     Saves all tolls retrieved from API call by filtering on toll genre and by checking duplicates.
+    The tolls pass through a pipeline of fetch, parse, dedup and write stages running concurrently.
+    The search resumes from the checkpoint of the last window fully saved, which is updated after each window.
+    By searching on acquisition date, each run retrieves only the tolls acquired after the previous one,
+    even if their exit date is older, so that the duplicates to be discarded are limited to the overlap days,
+    and the duplicates avoided against a search on tolls date are counted on database.
 
     :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
     :type toll_genre: str
     :param job_begin: The timestamp of the job starting.
     :type job_begin: datetime
+    :param workers: The maximum number of 7 days windows fetched concurrently, defaults to 1.
+    :type workers: int
+    :param batch_size: The number of tolls converted and saved together, defaults to 1000.
+    :type batch_size: int
+    :param use_index: Enable or disable the in memory index of saved tolls, checked before the database, defaults to False.
+    :type use_index: bool
+    :param date_type: The date type of the search windows, as tolls, acquisition or invoice, defaults to 'tolls'.
+    :type date_type: str
+    :param overlap: The days searched again before the checkpoint, to catch the tolls arrived late, defaults to 0.
+    :type overlap: int
+    :param parse_workers: The number of workers converting the tolls, defaults to 1.
+    :type parse_workers: int
+    :param write_workers: The number of workers writing the tolls on database, each one with its connection, defaults to 1.
+    :type write_workers: int
+    :param queue_size: The maximum number of batches waiting between two stages, defaults to 4.
+    :type queue_size: int
     """
-    querier: Querier = Querier(PATH_CFG, save_changes=True)
+    with querier_pool.checkout() as querier:
+        date_from, current_date = _get_checkpoint(querier, toll_genre, date_type, overlap), date.today()
 
-    date_from, current_date = querier.run(QUERY_GET_LAST_TOLL_DATE, toll_genre).fetch(Querier.FETCH_VAL), date.today()
-    if not date_from or date_from.date() > current_date:
-        date_from = current_date - timedelta(days=90)
-        logger.info('invalid or empty latest saved toll date... starting search from last 90 days (%s)', date_from)
-    else:
-        date_from = date_from.date()
-        logger.info('starting toll search from latest saved toll date... (%s)', date_from)
-
-    while date_from < current_date:
-        date_to = min(date_from + timedelta(days=7), current_date)
-
-        items = (feenox.get_invoice_tolls(tolls_date=(date_from, date_to))
-                if toll_genre == 'D'
-                else feenox.get_daily_tolls(tolls_date=(date_from, date_to)))
-        logger.info('searching toll of genre %s from date %s to %s... found %d records.',
-                    toll_genre, date_from, date_to, len(items))
-        # convert date field in datetime object and amount field in decimal object
-        for item in items:
-            toll: Toll = Toll(
-                id=item['id'],
-                toll_country=item['nation'],
-                toll_group=item['toll_group_code'],
-                toll_genre=item['type'],
-                toll_source=item['filename'] if toll_genre == 'P' else None,
-                acquisition_date=datetime.fromisoformat(item['acquisition_date']),
-                customer_code=item['customer_code'],
-                contract_code=item['contract_code'],
-                sign_of_transaction=item['sign_of_transaction'],
-                net_amount=Decimal(str(item['amount_no_vat'])),
-                gross_amount=Decimal(str(item['amount_including_vat'])),
-                vat_rate=Decimal(str(item['vat'])),
-                currency_code=item['currency_code'],
-                exchange_rate=Decimal(str(item['exchange_rate'])) if item['exchange_rate'] else None,
-                network_code=item['network_code'],
-                entry_gate_code=item['entry_global_gate_identifier'],
-                entry_gate_description=item['entry_global_gate_identifier_description'],
-                entry_date=(datetime.fromisoformat(item['entry_timestamp']) if item['entry_timestamp'] else None),
-                exit_gate_code=item['exit_global_gate_identifier'],
-                exit_gate_description=item['exit_global_gate_identifier_description'],
-                exit_date=datetime.fromisoformat(item['exit_timestamp']),
-                distance=Decimal(str(item['km'])) if item['km'] else None,
-                device_type=item['device_type'],
-                device_serial_number=item['obu'],
-                device_service_pan=item['pan_number'],
-                vehicle_plate=item['vehicle_plate'],
-                vehicle_country=item['vehicle_country'],
-                vehicle_euro_class=item['vehicle_euro_class'],
-                tariff_class=item['vehicle_tariff_class'],
-                invoice_article=item['invoice_article'] if toll_genre == 'D' else None,
-                invoice_number=item['invoice_nr'] if toll_genre == 'D' else None,
-                invoice_date=(datetime.fromisoformat(item['invoice_date']) if toll_genre == 'D' else None),
-                recording_date=job_begin
-            )
+        windows = []
+        while date_from < current_date:
+            date_to = min(date_from + timedelta(days=7), current_date)
+            windows.append((date_from, date_to))
+            date_from = date_to
+
+        index = None
+        if use_index and windows:
+            # the index is bound by the same date of the windows, so it covers the tolls searched again by the overlap
+            index = TollIndex(toll_genre, date_type).load(querier, windows[0][0])
+            logger.info('loaded toll index with %d records saved by %s date from %s', len(index), date_type, index.date_from)
+
+        # the tolls acquired before the windows are counted before saving the new ones, that can't be among them
+        avoided = (_count_duplicates_avoided(querier, toll_genre, windows[0][0], overlap)
+                   if date_type == 'acquisition' and windows else None)
 
-            is_duplicate = querier.run(QUERY_CHECK_DUPLICATE, toll.id, toll.global_identifier).fetch(Querier.FETCH_ONE)
-            if is_duplicate.nr_id:
-                # duplicate on id field is ok, means that row is already saved
-                logger.warning('discarding toll for error on CHECK_DUPLICATE... id already saved! (%s)', toll.id)
-            elif is_duplicate.nr_global_identifier:
-                # duplicate on global identifier means that row is really a duplicate
-                logger.error('discarding toll for error on CHECK_DUPLICATE... global identifier already saved! (%s)', toll.global_identifier)
-            elif querier.run(QUERY_INSERT_TOLL, *astuple(toll)).rows != 1:
-                logger.critical('error on saving toll record with id %s... check the database connection!', toll.id)
+        pipeline = _TollPipeline(toll_genre, date_type, windows, job_begin, index, queue_size)
+        pipeline.run(querier, workers, batch_size, parse_workers, write_workers)
 
-        date_from = date_to
-    del querier
+        # the duplicates encountered are the records retrieved again and discarded, so their rate shows how much
+        # the search still overlaps, while the duplicates avoided are the ones a search on tolls date would retrieve
+        logger.info('searched toll of genre %s by %s date... found %d records, %d duplicates encountered (%.1f%%)',
+                    toll_genre, date_type, pipeline.nr_total, pipeline.nr_duplicates,
+                    pipeline.nr_duplicates / pipeline.nr_total * 100 if pipeline.nr_total else 0)
+        if avoided is not None:
+            logger.info('searched toll of genre %s by %s date... %d duplicates avoided against tolls date',
+                        toll_genre, date_type, avoided)
+            metrics.count('tolls_duplicates_avoided', avoided, toll_genre=toll_genre)
+        if index is not None: index.save()
 
 
 def save_documents(document_type: str,
                    document_category: str = None,
-                   job_begin: datetime = datetime.now()) -> None:
+                   job_begin: datetime = datetime.now(),
+                   executor: ThreadPoolExecutor = None,
+                   workers: int = 4) -> None:
     """
     Saves and download all documents information from API call by filtering on document type and category.
+    A document is saved on database only if its file is downloaded, and its file is removed if the saving fails.
 
     :param document_type: The document type to be searched.
     :type document_type: str
@@ -211,34 +1063,212 @@ def save_documents(document_type: str,
     :type document_category: str
     :param job_begin: The timestamp of the job starting.
     :type job_begin: datetime
+    :param executor: The executor shared for downloading files, defaults to a new one with workers size.
+    :type executor: ThreadPoolExecutor
+    :param workers: The maximum number of concurrent downloads if no executor is passed, defaults to 4.
+    :type workers: int
     """
-    querier: Querier = Querier(PATH_CFG, save_changes=True)
-    logger.info('starting search documents with type %s%s', document_type,
-                f' and category {document_category}' if document_category else '')
-    response = feenox.get_documents(document_type, document_category)['documents']
-    documents = [var.id for var in querier.run(QUERY_GET_DOCUMENTS)]
-
-    # saving only document not yet in database, by filtering on document id
-    items = [item for item in response if item['documentId'] not in documents]
-    if items: logger.info('found %d new documents %s', len(items), [item['documentId'] for item in items])
-    else: logger.info('no new document found... %d records already saved on database', len(documents))
-    for item in items:
-        # convert date field in date object
-        document: Document = Document(
-            id=item['documentId'],
-            customer_code=item['customer'],
-            company_name=item['companyName'],
-            filename=item['fineName'],
-            document_date=date.fromisoformat(item['documentDate']),
-            publication_date=date.fromisoformat(item['documentPublicationDate']),
-            document_type=item['documentType']['name'],
-            document_category=item['documentCategory']['name'] if item['documentCategory'] else None,
-            recording_date=job_begin
-        )
+    with metrics.timer('save_documents', document_type=document_type), querier_pool.checkout() as querier:
+        logger.info('starting search documents with type %s%s', document_type,
+                    f' and category {document_category}' if document_category else '')
+        response = feenox.get_documents(document_type, document_category)['documents']
+        # saving only document not yet in database, by checking just the document ids retrieved
+        documents = _check_documents(querier, list(dict.fromkeys(item['documentId'] for item in response)))
+        items = [item for item in response if item['documentId'] not in documents]
+        metrics.count('documents_found', len(items), document_type=document_type)
+        if items: logger.info('found %d new documents %s', len(items), [item['documentId'] for item in items])
+        else: logger.info('no new document found... %d records already saved on database', len(documents))
+        new_documents: list[Document] = [Document.from_item(item, job_begin) for item in items]
+
+        if not new_documents: return
 
-        if querier.run(QUERY_INSERT_DOCUMENT, *astuple(document)).rows != 1:
-            logger.critical('error on saving document record with id %s... check the database connection!', document.id)
+        if executor:
+            downloads = _download_documents(new_documents, executor)
         else:
-            fou = feenox.download_document(document.id, PATH_RES)
-            logger.info('downloaded document locally (%s)', fou.as_posix())
-    del querier
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                downloads = _download_documents(new_documents, executor)
+
+        try:
+            querier.run_many(QUERY_INSERT_DOCUMENT, (document.params() for document, _ in downloads))
+        except Exception:
+            # remove the files of the documents not saved, the batches already saved are the first ones
+            for _, fou in downloads[querier.rows:]: fou.unlink(missing_ok=True)
+            logger.critical('error on saving %d document records... check the database connection!', len(downloads) - querier.rows)
+            raise
+        logger.info('saved %d new documents in %d batches %s', querier.rows, len(querier.batch_rows), querier.batch_rows)
+        metrics.count('documents_saved', querier.rows, document_type=document_type)
+
+
+def sync_documents(document_types: Sequence[str | tuple[str, str]],
+                   job_begin: datetime = datetime.now(),
+                   executor: ThreadPoolExecutor = None,
+                   workers: int = 8,
+                   incremental: bool = False,
+                   overlap: int = 1,
+                   max_failures: int = 3) -> None:
+    """
+    Saves and download all documents information of more types together, as an invoice with its attachments.
+    The documents of all types are searched concurrently and checked against the database in a single pass,
+    then their files are downloaded by the same workers. The documents are grouped by customer and document date,
+    and each group is saved in a single commit only if all its files are downloaded, otherwise it's retried next run.
+    Each failed download is counted on database, and a document failed in max_failures runs is quarantined:
+    its group is saved without it, so that a file removed from the API doesn't hold back the group forever.
+    In incremental mode each type is searched only from the publication date of its checkpoint,
+    which is moved forward at the end of the run, but not beyond the oldest document discarded.
+
+    :param document_types: The document types to be searched, each one as type or as tuple of type and category.
+    :type document_types: Sequence[str | tuple[str, str]]
+    :param job_begin: The timestamp of the job starting.
+    :type job_begin: datetime
+    :param executor: The executor shared for searching documents and downloading files, defaults to a new one with workers size.
+    :type executor: ThreadPoolExecutor
+    :param workers: The maximum number of concurrent API calls if no executor is passed, defaults to 8.
+    :type workers: int
+    :param incremental: Enable or disable the search from the publication date checkpoint, defaults to False.
+    :type incremental: bool
+    :param overlap: The days searched again before the checkpoint in incremental mode, defaults to 1.
+    :type overlap: int
+    :param max_failures: The failed downloads in different runs after which a document is quarantined, defaults to 3.
+    :type max_failures: int
+    """
+    if not executor:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sync_documents(document_types, job_begin, executor, incremental=incremental, overlap=overlap,
+                                  max_failures=max_failures)
+
+    def search_documents(document_type: str, document_category: str | None) -> dict[str, list[dict[str, Any]]]:
+        with metrics.timer('document_search', document_type=document_type):
+            return feenox.get_documents(document_type, document_category, publication_date=windows.get(document_type))
+
+    def download_document(document: Document) -> Path:
+        with metrics.timer('document_download', 1, document_type=document.document_type):
+            return feenox.download_document(document.id, PATH_RES)
+
+    searches = [(var, None) if isinstance(var, str) else tuple(var) for var in document_types]
+    # checkpoints: the document types with a checkpoint, once each even if searched by more categories
+    checkpoints = list(dict.fromkeys(document_type for document_type, _ in searches)) if incremental else []
+    with metrics.timer('sync_documents'), querier_pool.checkout() as querier:
+        current_date, windows = date.today(), {}
+        for document_type in checkpoints:
+            # without checkpoint all the documents of the type are searched
+            if date_from := querier.run(QUERY_GET_DOCUMENT_CHECKPOINT, document_type).fetch(Querier.FETCH_VAL):
+                windows[document_type] = (min(date_from - timedelta(days=overlap), current_date), current_date)
+                logger.info('starting search documents with type %s from latest publication date... (%s)',
+                            document_type, windows[document_type][0])
+
+        futures = [
+            executor.submit(search_documents, document_type, document_category)
+            for document_type, document_category in searches
+        ]
+        # the same document could be retrieved by more searches, so keep it once by document id
+        items: dict[str, dict[str, Any]] = {}
+        for (document_type, document_category), future in zip(searches, futures):
+            response = future.result()['documents']
+            logger.info('searching documents with type %s%s... found %d records.', document_type,
+                        f' and category {document_category}' if document_category else '', len(response))
+            for item in response: items.setdefault(item['documentId'], item)
+
+        documents = _check_documents(querier, list(items))
+        groups: dict[tuple[str, date], list[Document]] = {}
+        for document_id, item in items.items():
+            if document_id in documents: continue
+            document = Document.from_item(item, job_begin)
+            groups.setdefault((document.customer_code, document.document_date), []).append(document)
+            metrics.count('documents_found', document_type=document.document_type)
+        if groups: logger.info('found %d new documents in %d groups', sum(map(len, groups.values())), len(groups))
+        else: logger.info('no new document found... %d records already saved on database', len(documents))
+
+        # the quarantined documents are no more downloaded, and they don't hold back their group nor the checkpoint
+        failures = _get_document_failures(querier, [document.id for group in groups.values() for document in group])
+        for (customer_code, document_date), group in groups.items():
+            if not (quarantined := [document for document in group if failures.get(document.id, 0) >= max_failures]):
+                continue
+            logger.error('quarantined %d documents of customer %s with date %s after %d failed downloads... '
+                         'saving the group without them! (%s)', len(quarantined), customer_code, document_date,
+                         max_failures, [document.id for document in quarantined])
+            for document in quarantined: metrics.count('documents_quarantined', document_type=document.document_type)
+            group[:] = [document for document in group if failures.get(document.id, 0) < max_failures]
+        groups = {key: group for key, group in groups.items() if group}
+
+        # the files are downloaded in group order, so that the first groups are saved while the others are downloading
+        discarded: dict[str, date] = {}
+        saved: set[str] = set()
+        downloads = {
+            document.id: executor.submit(download_document, document)
+            for group in groups.values() for document in group
+        }
+        try:
+            for (customer_code, document_date), group in groups.items():
+                files, failed = [], {}
+                for document in group:
+                    try:
+                        fou = downloads[document.id].result()
+                    except Exception as exc:
+                        logger.error('error on downloading document with id %s... discarding document! (%s)', document.id, exc)
+                        # the failure is counted on database, so that the document is quarantined after too many runs
+                        querier.run(QUERY_UPSERT_DOCUMENT_FAILURE, document.id, document.document_type,
+                                    document.customer_code, document.document_date, document.publication_date,
+                                    str(exc), job_begin)
+                        failed[document.id] = failures.get(document.id, 0) + 1
+                    else:
+                        logger.info('downloaded document locally (%s)', fou.as_posix())
+                        files.append(fou)
+
+                if failed:
+                    for fou in files: fou.unlink(missing_ok=True)
+                    logger.error('discarding %d documents of customer %s with date %s... not all files downloaded! '
+                                 '(failed downloads by id %s, quarantined at %d)', len(group), customer_code,
+                                 document_date, failed, max_failures)
+                    # the checkpoint must not go beyond the discarded documents, so that they're searched again next run
+                    for document in group:
+                        discarded[document.document_type] = min(discarded.get(document.document_type, current_date),
+                                                                document.publication_date)
+                    continue
+
+                try:
+                    # the whole group is sent as a single batch, so it's saved in a single commit
+                    querier.run_many(QUERY_INSERT_DOCUMENT, (document.params() for document in group),
+                                     batch_size=len(group))
+                except Exception:
+                    logger.critical('error on saving %d document records... check the database connection!', len(group))
+                    raise
+                saved.update(document.id for document in group)
+                logger.info('saved %d new documents of customer %s with date %s', querier.rows, customer_code, document_date)
+                for document in group: metrics.count('documents_saved', document_type=document.document_type)
+        finally:
+            # a file is kept only with its record, so on error or interruption the files of the documents not saved
+            # are removed, by waiting also for the downloads still running
+            for future in downloads.values(): future.cancel()
+            for document_id, future in downloads.items():
+                if document_id in saved or future.cancelled(): continue
+                try:
+                    fou = future.result()
+                except Exception:
+                    continue
+                fou.unlink(missing_ok=True)
+
+        for document_type in checkpoints:
+            querier.run(QUERY_UPSERT_DOCUMENT_CHECKPOINT, document_type,
+                        min(discarded.get(document_type, current_date), current_date), job_begin)
+
+
+def log_query_stats() -> None:
+    """
+    Log the executions, the prepared statement hit rate and the average latency of each query run during the job,
+    named after its constant in the constants module, by adding them also to the job metrics.
+    """
+    # the query templates with placeholders are matched by the text before the first placeholder
+    names = {getattr(constants, name).split('{')[0]: name for name in dir(constants) if name.startswith('QUERY_')}
+    res: dict[str, StatementStats] = {}
+    for query, stats in Querier.statement_stats().items():
+        name = next((name for text, name in names.items() if query.startswith(text)), ' '.join(query.split())[:50])
+        # the query strings of the same template, as the batches of different size, are combined together
+        var = res.setdefault(name, StatementStats())
+        var.calls, var.hits, var.elapsed = var.calls + stats.calls, var.hits + stats.hits, var.elapsed + stats.elapsed
+
+    for name, stats in sorted(res.items(), key=lambda item: item[1].elapsed, reverse=True):
+        logger.info('query %s run %d times... hit rate %.1f%%, average latency %.3f ms, total %.3f s',
+                    name, stats.calls, stats.hit_rate * 100, stats.latency * 1000, stats.elapsed)
+        metrics.count('db_round_trips', stats.calls, query=name)
+        metrics.count('db_cache_hits', stats.hits, query=name)
+        metrics.count('db_seconds', stats.elapsed, query=name)
@@ -0,0 +1,183 @@
+import json
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:
+    # on Windows the lock file is locked by msvcrt instead of fcntl
+    fcntl = None
+    import msvcrt
+
+from core import decode_json, write_atomic
+from .constants import PATH_PRJ
+
+
+@contextmanager
+def _lock_file(fin: Path) -> Iterator[None]:
+    """
+    Lock exclusively a file across processes, by waiting until it's released by the other processes.
+
+    :param fin: The path to the lock file, created if it doesn't exist.
+    :type fin: Path
+    :return: The context in which the lock is held.
+    :rtype: Iterator[None]
+    """
+    with open(fin, 'a+b') as lock:
+        if fcntl:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            # msvcrt gives up after 10 seconds of waiting, so keep trying until the lock is got
+            while True:
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class TokenManager:
+    """
+    The TokenManager object keeps a valid token shared by threads and processes through a cache file.
+    The token is refreshed by a single worker at a time, while the others wait and then reuse the new token.
+    """
+    def __init__(self,
+                 login: Callable[[], dict[str, Any]],
+                 fin: str | Path = PATH_PRJ / '.cache',
+                 margin: float = 60,
+                 refresh_ahead: float = 300) -> None:
+        """
+        Initialize the manager without any token, that will be read from the cache file or retrieved at first request.
+
+        :param login: The function making the login call, returning a dictionary with the token and its expire datetime.
+        :type login: Callable[[], dict[str, Any]]
+        :param fin: The path to the cache file, defaults to the .cache file in the project root.
+        :type fin: str | Path
+        :param margin: The seconds before the expire from which the token is no more valid, defaults to 60.
+        :type margin: float
+        :param refresh_ahead: The seconds before the expire from which the token is refreshed in background, defaults to 300.
+        :type refresh_ahead: float
+        """
+        self._login: Callable[[], dict[str, Any]] = login
+        self._fin: Path = Path(fin).resolve()
+        self._lock_fin: Path = self._fin.with_name(f'{self._fin.name}.lock')
+        self.margin: float = margin
+        self.refresh_ahead: float = refresh_ahead
+
+        self._token: dict[str, Any] | None = None
+        self._lock: threading.Lock = threading.Lock()
+        self._refresher: threading.Thread | None = None
+        self._stopped: threading.Event = threading.Event()
+
+    @staticmethod
+    def _is_valid(token: dict[str, Any] | None,
+                  margin: float) -> bool:
+        """
+        Check if a token is still valid for more than the margin seconds.
+
+        :param token: The token with its expire datetime.
+        :type token: dict[str, Any] | None
+        :param margin: The seconds before the expire from which the token is no more valid.
+        :type margin: float
+        :return: True if the token is still valid, False otherwise.
+        :rtype: bool
+        """
+        return token is not None and token['expire'] - datetime.now() > timedelta(seconds=margin)
+
+    def _read(self) -> dict[str, Any] | None:
+        """
+        Read the token from the cache file.
+
+        :return: The token with its expire datetime, or None if the cache file is missing or not valid.
+        :rtype: dict[str, Any] | None
+        """
+        if not self._fin.is_file(): return None
+        try:
+            token = decode_json(self._fin)
+            token['expire'] = datetime.fromisoformat(token['expire'])
+        except (ValueError, KeyError, TypeError):
+            # the cache file is corrupted, it will be replaced by the next login
+            return None
+        return token
+
+    def _write(self,
+               token: dict[str, Any]) -> None:
+        """
+        Save the token on the cache file, read by the other processes.
+
+        :param token: The token with its expire datetime.
+        :type token: dict[str, Any]
+        """
+        write_atomic(self._fin, json.dumps({'token': token['token'], 'expire': token['expire'].isoformat()}))
+
+    def get(self,
+            force: bool = False,
+            margin: float = None) -> dict[str, Any]:
+        """
+        Get a valid token, by reading it from the cache file or by making the login call if expired.
+        Only one worker at a time refreshes the token, the others wait for it and reuse the new token.
+
+        :param force: Force the login call, even if the current token is still valid, defaults to False.
+        :type force: bool
+        :param margin: The seconds before the expire from which the token is no more valid, defaults to the manager one.
+        :type margin: float
+        :return: The token with its expire datetime.
+        :rtype: dict[str, Any]
+        """
+        margin = self.margin if margin is None else margin
+        if not force and TokenManager._is_valid(token := self._token, margin): return token
+
+        with self._lock:
+            # the token could be already refreshed by another thread while waiting for the lock
+            if not force and TokenManager._is_valid(self._token, margin): return self._token
+            with _lock_file(self._lock_fin):
+                # the token could be already refreshed by another process while waiting for the lock
+                if force or not TokenManager._is_valid(token := self._read(), margin):
+                    token = self._login()
+                    self._write(token)
+                self._token = token
+        return token
+
+    def start(self) -> None:
+        """
+        Start the background refresh of the token, before it expires, if not already started.
+        """
+        if self._refresher and self._refresher.is_alive(): return
+        self._stopped.clear()
+        self._refresher = threading.Thread(target=self._refresh, name='TokenManager', daemon=True)
+        self._refresher.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background refresh of the token.
+        """
+        self._stopped.set()
+        if self._refresher: self._refresher.join()
+        self._refresher = None
+
+    def _refresh(self) -> None:
+        """
+        Refresh the token each time it's going to expire in less than the refresh ahead seconds, until stopped.
+        """
+        while True:
+            remaining = (self._token['expire'] - datetime.now()).total_seconds() if self._token else 0
+            # a token lasting less than the refresh ahead seconds is refreshed at half of its life
+            if self._stopped.wait(max(remaining - self.refresh_ahead, remaining / 2, 1)): return
+            try:
+                self.get(margin=self.refresh_ahead)
+            except Exception:
+                # the refresh will be retried later, or done by the first API call needing the token
+                if self._stopped.wait(self.margin): return
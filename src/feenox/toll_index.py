@@ -0,0 +1,135 @@
+import json
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Self
+
+from core import Querier, decode_json, write_atomic
+from .constants import PATH_PRJ, QUERY_GET_TOLL_INDEX
+
+# _DATE_COLUMNS: the toll column bounding the index for each date type, the same searched by the toll windows
+_DATE_COLUMNS: dict[str, str] = {
+    'tolls': 'exit_date',
+    'acquisition': 'acquisition_date',
+    'invoice': 'invoice_date'
+}
+
+
+class TollIndex:
+    """
+    The TollIndex object keeps in memory the ids and global identifiers of the tolls already saved on database.
+    The index covers a toll genre from a date of the same type searched by the toll windows, so that the tolls
+    retrieved again by the overlap are found in it, and the tolls older than that date are pruned.
+    The index can be persisted on a snapshot file, so that a following run reads from database only the newer tolls.
+    """
+    def __init__(self,
+                 toll_genre: str,
+                 date_type: str = 'tolls',
+                 fin: str | Path = None) -> None:
+        """
+        Initialize an empty index of a toll genre, bound to its snapshot file.
+
+        :param toll_genre: The toll genre that indicates daily (P) or invoice (D) tolls.
+        :type toll_genre: str
+        :param date_type: The date type bounding the index, as tolls, acquisition or invoice, defaults to 'tolls'.
+        :type date_type: str
+        :param fin: The path to the snapshot file, defaults to the .index file of the genre and date type in the project root.
+        :type fin: str | Path
+        """
+        self.toll_genre: str = toll_genre
+        self.date_type: str = date_type
+        # date_column: the toll column of the date type, named as the Toll field
+        self.date_column: str = _DATE_COLUMNS[date_type]
+        self._fin: Path = Path(fin or PATH_PRJ / f'.index_{toll_genre}_{date_type}').resolve()
+        # date_from: the lower bound of the toll date of the date type indexed
+        self.date_from: date | None = None
+        # recording_date: the latest toll recording date read from database
+        self.recording_date: datetime | None = None
+        self.ids: set[str] = set()
+        self.global_identifiers: set[str] = set()
+        # _days: the ids and global identifiers of the tolls by their date, to prune the ones older than date_from
+        self._days: dict[date, list[tuple[str, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def load(self,
+             querier: Querier,
+             date_from: date) -> Self:
+        """
+        Load the index from the snapshot file and from the tolls saved on database after it.
+        The snapshot is discarded if it doesn't cover the date range or if it's older than 90 days,
+        otherwise only its tolls from the lower bound date are kept.
+
+        :param querier: The Querier object connected to the database.
+        :type querier: Querier
+        :param date_from: The lower bound of the toll date of the date type to be indexed.
+        :type date_from: date
+        :return: The object itself, so that calls can be chained.
+        :rtype: TollIndex
+        """
+        self.date_from, self.recording_date = date_from, None
+        self.ids, self.global_identifiers, self._days = set(), set(), {}
+
+        if self._fin.is_file():
+            snapshot = decode_json(self._fin)
+            snapshot_from = date.fromisoformat(snapshot['date_from'])
+            # a snapshot bound by another genre or date type doesn't cover the same tolls
+            if ((snapshot.get('toll_genre'), snapshot.get('date_type')) == (self.toll_genre, self.date_type)
+                    and 'days' in snapshot and date.today() - timedelta(days=90) <= snapshot_from <= date_from):
+                self.recording_date = datetime.fromisoformat(snapshot['recording_date'])
+                for day, tolls in snapshot['days'].items():
+                    if (day := date.fromisoformat(day)) < date_from: continue
+                    for toll_id, global_identifier in tolls: self.add(toll_id, global_identifier, day)
+
+        # read only the tolls saved after the snapshot, or all tolls in date range if there isn't snapshot
+        query = QUERY_GET_TOLL_INDEX.format(date_column=self.date_column)
+        querier.run(query, self.toll_genre, datetime.combine(self.date_from, datetime.min.time()),
+                    self.recording_date or datetime.min)
+        for batch in querier.stream(Querier.STREAM_COLUMNS, size=10000):
+            for toll_id, global_identifier, toll_date in zip(batch['id'], batch['global_identifier'], batch['toll_date']):
+                self.add(toll_id, global_identifier, toll_date)
+            self.recording_date = max(self.recording_date or datetime.min, *batch['recording_date'])
+        return self
+
+    def prune(self) -> None:
+        """
+        Remove from the index the tolls older than its lower bound date, not searched again by the toll windows.
+        """
+        for day in [day for day in self._days if day < self.date_from]:
+            for toll_id, global_identifier in self._days.pop(day):
+                self.ids.discard(toll_id)
+                self.global_identifiers.discard(global_identifier)
+
+    def save(self) -> None:
+        """
+        Persist the index on the snapshot file, after pruning the tolls older than its lower bound date.
+        """
+        if not self.date_from: return
+
+        self.prune()
+        write_atomic(self._fin, json.dumps({
+            'toll_genre': self.toll_genre,
+            'date_type': self.date_type,
+            'date_from': self.date_from.isoformat(),
+            'recording_date': (self.recording_date or datetime.min).isoformat(),
+            'days': {day.isoformat(): tolls for day, tolls in self._days.items()}
+        }))
+
+    def add(self,
+            toll_id: str,
+            global_identifier: str,
+            toll_date: date | None) -> None:
+        """
+        Add a toll just saved on database to the index.
+
+        :param toll_id: The toll id.
+        :type toll_id: str
+        :param global_identifier: The toll global identifier.
+        :type global_identifier: str
+        :param toll_date: The toll date of the date type, a toll without it is kept until the next prune.
+        :type toll_date: date | None
+        """
+        if isinstance(toll_date, datetime): toll_date = toll_date.date()
+        self.ids.add(toll_id)
+        self.global_identifiers.add(global_identifier)
+        self._days.setdefault(toll_date or self.date_from, []).append((toll_id, global_identifier))
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 import feenox
-from core import get_logger
+from core import get_logger, metrics
 
 logger = get_logger(feenox.PATH_LOG)
 
@@ -9,16 +9,26 @@ if __name__ == '__main__':
     job_begin = datetime.now()
 
     try:
-        feenox.save_toll_groups()
+        with metrics.timer('stage', stage='save_toll_groups'):
+            feenox.save_toll_groups()
 
-        # save new daily tolls
-        feenox.save_tolls('P', job_begin=job_begin)
+        # save new daily tolls, by searching the ones acquired after the last run
+        with metrics.timer('stage', stage='save_daily_tolls'):
+            feenox.save_tolls('P', job_begin=job_begin, workers=4, use_index=True, date_type='acquisition', overlap=1,
+                              write_workers=2)
         # save new invoice tolls
-        feenox.save_tolls('D', job_begin=job_begin)
+        with metrics.timer('stage', stage='save_invoice_tolls'):
+            feenox.save_tolls('D', job_begin=job_begin, workers=4, use_index=True, date_type='acquisition', overlap=1,
+                              write_workers=2)
 
-        # download invoice documents
-        feenox.save_documents('FATTURA', job_begin=job_begin)
-        feenox.save_documents('ALLEGATO_FATTURA', job_begin=job_begin)
-        feenox.save_documents('ALLEGATO_FATTURA_CSV', job_begin=job_begin)
-        feenox.save_documents('ALLEGATO_FATTURA_TXT', job_begin=job_begin)
+        # download invoice documents with their attachments, sharing the same workers
+        with metrics.timer('stage', stage='sync_documents'):
+            feenox.sync_documents(['FATTURA', 'ALLEGATO_FATTURA', 'ALLEGATO_FATTURA_CSV', 'ALLEGATO_FATTURA_TXT'],
+                                  job_begin=job_begin, workers=8, incremental=True, overlap=1)
     except Exception: logger.exception('unhandled exception')
+    finally:
+        feenox.log_query_stats()
+        feenox.querier_pool.close()
+        # save the run summary, to track the job performance between runs
+        metrics.save_json(feenox.PATH_METRICS)
+        metrics.save_prometheus(feenox.PATH_METRICS.with_suffix('.prom'))
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the packages are run from the src folder, as done by main.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
@@ -0,0 +1,94 @@
+import random
+from dataclasses import fields, replace
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from feenox.recording_fees import Toll, _format_identifier, build_global_identifiers
+
+# _DECIMALS: the amounts formatted by quantize, with negative, exponent and signed zero values
+_DECIMALS = [
+    Decimal('0'), Decimal('-0'), Decimal('1'), Decimal('-1'), Decimal('12.1'), Decimal('-500.12345'),
+    Decimal('1E+2'), Decimal('-1E+3'), Decimal('1E-5'), Decimal('-2.5E-3'), Decimal('1.123456'), Decimal('99999.99999'),
+    Decimal('22'), Decimal('22.0'), Decimal('0.000001')
+]
+# _DATETIMES: the timestamps formatted by strftime, with the years before 1000 not padded by it
+_DATETIMES = [
+    datetime(2025, 1, 1), datetime(2025, 12, 31, 23, 59, 59), datetime(1999, 2, 3, 4, 5, 6, 789),
+    datetime(1000, 1, 1), datetime(999, 12, 31, 23, 59, 59), datetime(50, 6, 7, 8, 9, 10), datetime(1, 1, 1)
+]
+_STRINGS = ['', 'A', 'G01', 'C001', '+', '-', 'N#1', ' spaced ', 'àèì']
+
+
+def _random_value(rnd: random.Random,
+                  genre: type) -> object:
+    if genre is datetime:
+        return rnd.choice(_DATETIMES) if rnd.random() < 0.3 else datetime(2025, 1, 1) + timedelta(seconds=rnd.randrange(10 ** 8))
+    elif genre is Decimal:
+        return rnd.choice(_DECIMALS) if rnd.random() < 0.5 else Decimal(str(round(rnd.uniform(-1000, 1000), rnd.randint(0, 7))))
+    return rnd.choice(_STRINGS)
+
+
+def _random_toll(rnd: random.Random,
+                 str_only: bool = False) -> Toll:
+    """
+    Generate a toll with random values of each field type, None included for the optional ones.
+    """
+    values = {}
+    for var in fields(Toll):
+        if var.name == 'global_identifier': continue
+        genre = str if str_only or 'str' in str(var.type) else Decimal if 'Decimal' in str(var.type) else datetime
+        values[var.name] = None if 'None' in str(var.type) and rnd.random() < 0.3 else _random_value(rnd, genre)
+    return Toll(**values)
+
+
+def _check(tolls: list[Toll]) -> None:
+    # the tolls are built again with deferred global identifier, as done by Toll.from_items
+    deferred = [replace(toll, global_identifier='') for toll in tolls]
+    assert build_global_identifiers(deferred) == [toll.global_identifier for toll in tolls]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_tolls(seed: int) -> None:
+    rnd = random.Random(seed)
+    _check([_random_toll(rnd) for _ in range(rnd.randint(1, 300))])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_string_columns(seed: int) -> None:
+    # all the values are strings or None, so every column takes the fast path
+    rnd = random.Random(seed)
+    _check([_random_toll(rnd, str_only=True) for _ in range(100)])
+
+
+def test_edge_values() -> None:
+    rnd = random.Random(0)
+    tolls = []
+    for var in _DECIMALS:
+        tolls.append(replace(_random_toll(rnd), net_amount=var, exchange_rate=var, global_identifier=None))
+    for var in _DATETIMES:
+        tolls.append(replace(_random_toll(rnd), acquisition_date=var, entry_date=var, global_identifier=None))
+    for var in (None, ''):
+        tolls.append(replace(_random_toll(rnd), network_code=var, entry_date=None, exchange_rate=None,
+                             device_service_pan=var, invoice_number=var, invoice_date=None, global_identifier=None))
+    _check(tolls)
+
+
+def test_mixed_column() -> None:
+    # a value not of string type in a string column moves the whole column to the per value formatting
+    rnd = random.Random(0)
+    tolls = [_random_toll(rnd) for _ in range(10)]
+    tolls[3] = replace(tolls[3], customer_code=123, device_service_pan=Decimal('-1E+2'), global_identifier=None)
+    _check(tolls)
+
+
+@pytest.mark.parametrize('var', _DATETIMES)
+def test_format_datetime(var: datetime) -> None:
+    # the years before 1000 fall back to strftime, so they're formatted as Toll.__post_init__ does on any platform
+    assert _format_identifier(var) == var.strftime('%Y%m%d%H%M%S')
+
+
+@pytest.mark.parametrize('var', _DECIMALS)
+def test_format_decimal(var: Decimal) -> None:
+    assert _format_identifier(var) == str(var.quantize(Decimal('1e-5'))).replace('.', '').rjust(11, '0')
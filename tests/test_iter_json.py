@@ -0,0 +1,60 @@
+import json
+import random
+from decimal import Decimal
+
+import pytest
+
+from feenox.feenox import Feenox
+
+# _VALUES: the items of the arrays, with the numbers whose prefix is a valid number too
+_VALUES = [
+    0, 1, -1, 12, 1.5, -0.25, 1e10, 1.5e-7, 2E+3, 'text', '', 'àèì "quoted" \\\\ \\u00e8', True, False, None,
+    [], {}, [1, [2.5, 'x']], {'a': 1.25, 'b': [None, 'c'], 'd': {'e': -3e2}}
+]
+
+
+def _random_array(rnd: random.Random) -> str:
+    items = [rnd.choice(_VALUES) for _ in range(rnd.randint(0, 20))]
+    return json.dumps(items, indent=rnd.choice([None, 2]), separators=rnd.choice([None, (',', ':')]))
+
+
+def _split(data: bytes,
+           rnd: random.Random) -> list[bytes]:
+    cuts = sorted(rnd.sample(range(1, len(data)), min(len(data) - 1, rnd.randint(0, 10)))) if len(data) > 1 else []
+    return [data[begin:end] for begin, end in zip([0, *cuts], [*cuts, len(data)])]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_chunk_boundaries(seed: int) -> None:
+    # each array is decoded the same as by the standard decoder, wherever the chunks are split
+    rnd = random.Random(seed)
+    for _ in range(250):
+        text = _random_array(rnd)
+        expected = json.loads(text, parse_float=Decimal)
+        assert list(Feenox._iter_json(_split(text.encode(), rnd))) == expected
+        batches = list(Feenox._iter_json(_split(text.encode(), rnd), batch_size=3))
+        assert [item for batch in batches for item in batch] == expected
+
+
+@pytest.mark.parametrize('chunks', [
+    [b'[1.', b'5]'], [b'[1', b'.5]'], [b'[1.5', b'e-3]'], [b'[1.5e', b'-3]'], [b'[1.5e-', b'3]'], [b'[-', b'2]'],
+    [b'[1', b'2', b'3]'], [b'[tr', b'ue]'], [b'["\\', b'u00e8"]'], [b'["\xc3', b'\xa8"]']
+])
+def test_split_tokens(chunks: list[bytes]) -> None:
+    assert list(Feenox._iter_json(chunks)) == json.loads(b''.join(chunks), parse_float=Decimal)
+
+
+@pytest.mark.parametrize('text', [
+    '', ' ', '{}', '1', '[', '[1', '[1,', '[,1]', '[1,]', '[1 2]', '[1]x', '[1] ]', '[1],', '[1]]', '[01]', '[1.]'
+])
+def test_invalid(text: str) -> None:
+    with pytest.raises(json.JSONDecodeError):
+        list(Feenox._iter_json([text.encode()]))
+    # the same errors are raised when the text is read one byte at a time
+    with pytest.raises(json.JSONDecodeError):
+        list(Feenox._iter_json([bytes([var]) for var in text.encode()]))
+
+
+def test_trailing_blanks() -> None:
+    assert list(Feenox._iter_json([b' [ 1 , 2 ] ', b'\n', b''])) == [1, 2]
+    assert list(Feenox._iter_json([b'[]\r\n'])) == []
@@ -0,0 +1,49 @@
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+from core import LowQuerier, Querier
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+class _Cursor(list):
+    """
+    A query result with typed values, as returned by pyodbc and not by SQLite.
+    """
+    description = [('customer_code',), ('entry_date',), ('exchange_rate',), ('invoice_date',)]
+
+
+_ROWS = [
+    ('C001', None, None, None),
+    ('C002', datetime(2026, 1, 2, 3, 4, 5), Decimal('1.12345'), None),
+    (None, datetime(2026, 1, 3), None, date(2026, 2, 1)),
+    ('C004', None, Decimal('2'), date(2026, 2, 2))
+]
+
+
+def _save(tmp_path: Path,
+          max_rows: int = Querier.EXCEL_MAX_ROWS) -> list[list[tuple]]:
+    with LowQuerier() as querier:
+        querier._cursor = _Cursor(_ROWS)
+        querier.save_excel(tmp_path / 'result.xlsx', sheet_name='result', max_rows=max_rows)
+    wb = openpyxl.load_workbook(tmp_path / 'result.xlsx')
+    return [[(cell.value, cell.number_format) for cell in row] for ws in wb for row in ws.iter_rows(min_row=2)]
+
+
+@pytest.mark.parametrize('max_rows', [Querier.EXCEL_MAX_ROWS, 2])
+def test_nullable_columns(tmp_path: Path,
+                          max_rows: int) -> None:
+    # the columns with NULL in the first row get the format of their first value not NULL, on every sheet
+    formats = {type(value): Querier._EXCEL_FORMATS[type(value)] for row in _ROWS for value in row if value is not None}
+    for row, cells in zip(_ROWS, _save(tmp_path, max_rows)):
+        for value, (cell, number_format) in zip(row, cells):
+            if value is None:
+                assert cell is None
+            else:
+                assert number_format == formats[type(value)]
+                # the dates are read back as datetimes and the decimals as floats
+                assert cell == (datetime.combine(value, datetime.min.time()) if type(value) is date
+                                else float(value) if type(value) is Decimal else value)
@@ -0,0 +1,75 @@
+import json
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from core import Querier
+from feenox.toll_index import TollIndex
+
+
+class _Querier:
+    """
+    A database of tolls answering only the index query, with the dates typed as returned by pyodbc.
+    """
+    def __init__(self,
+                 tolls: list[tuple[str, str, datetime, datetime]]) -> None:
+        self.tolls, self.queries = tolls, []
+
+    def run(self,
+            query: str,
+            toll_genre: str,
+            date_from: datetime,
+            recording_date: datetime) -> '_Querier':
+        self.queries.append((query, date_from, recording_date))
+        self._rows = [toll for toll in self.tolls if toll[2] >= date_from and toll[3] >= recording_date]
+        return self
+
+    def stream(self,
+               genre: int,
+               size: int) -> list[dict[str, list]]:
+        assert genre == Querier.STREAM_COLUMNS
+        header = ['id', 'global_identifier', 'toll_date', 'recording_date']
+        return [dict(zip(header, map(list, zip(*self._rows))))] if self._rows else []
+
+
+def _toll(nr: int,
+          day: date,
+          recording_date: datetime) -> tuple[str, str, datetime, datetime]:
+    return f'id{nr}', f'gid{nr}', datetime.combine(day, datetime.min.time()) + timedelta(hours=nr % 24), recording_date
+
+
+def test_prune_on_load_and_save(tmp_path: Path) -> None:
+    today, recorded = date.today(), datetime.now() - timedelta(days=1)
+    querier = _Querier([_toll(nr, today - timedelta(days=nr), recorded) for nr in range(10)])
+
+    index = TollIndex('P', 'acquisition', tmp_path / '.index').load(querier, today - timedelta(days=5))
+    assert index.ids == {f'id{nr}' for nr in range(6)}
+    assert 'acquisition_date' in querier.queries[-1][0]
+
+    # the tolls saved by the run are added by their date, and the next run moves the lower bound forward
+    index.add('id10', 'gid10', datetime.combine(today, datetime.min.time()))
+    index.date_from = today - timedelta(days=1)
+    index.save()
+    snapshot = json.loads((tmp_path / '.index').read_text())
+    assert sorted(snapshot['days']) == [(today - timedelta(days=1)).isoformat(), today.isoformat()]
+    assert index.ids == {'id0', 'id1', 'id10'} and index.global_identifiers == {'gid0', 'gid1', 'gid10'}
+
+    # the snapshot is reused, and only the tolls recorded after it are read from database
+    querier.tolls.append(_toll(11, today, datetime.now()))
+    index = TollIndex('P', 'acquisition', tmp_path / '.index').load(querier, today)
+    assert querier.queries[-1][2] == recorded
+    assert index.ids == {'id0', 'id10', 'id11'}
+
+
+def test_snapshot_not_covering(tmp_path: Path) -> None:
+    today, recorded = date.today(), datetime.now() - timedelta(days=1)
+    querier = _Querier([_toll(nr, today - timedelta(days=nr), recorded) for nr in range(10)])
+    TollIndex('P', 'acquisition', tmp_path / '.index').load(querier, today - timedelta(days=2)).save()
+
+    # an older lower bound isn't covered by the snapshot, so all the tolls are read again
+    index = TollIndex('P', 'acquisition', tmp_path / '.index').load(querier, today - timedelta(days=4))
+    assert querier.queries[-1][2] == datetime.min
+    assert index.ids == {f'id{nr}' for nr in range(5)}
+
+    # a snapshot of another date type is discarded
+    index = TollIndex('P', 'tolls', tmp_path / '.index').load(querier, today - timedelta(days=4))
+    assert querier.queries[-1][2] == datetime.min and 'exit_date' in querier.queries[-1][0]